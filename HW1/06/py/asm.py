@@ -1,6 +1,129 @@
-from code import Code
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from code import encode_c_instruction
 
-code = Code()
+# 預先定義的符號 (Hack 規格)
+PREDEFINED_SYMBOLS = {
+    'SP': 0, 'LCL': 1, 'ARG': 2, 'THIS': 3, 'THAT': 4,
+    'SCREEN': 16384, 'KBD': 24576,
+}
+PREDEFINED_SYMBOLS.update({f'R{i}': i for i in range(16)})
+
+VAR_BASE = 16 # 變數從 RAM[16] 開始配置
+
+class SymbolTable:
+    def __init__(self):
+        self.symbols = dict(PREDEFINED_SYMBOLS)
+        self.var_top = VAR_BASE
+
+    def add_label(self, label, address):
+        if label in self.symbols:
+            raise SyntaxError(f"symbol '{label}' already defined before !")
+        self.symbols[label] = address # 記住符號位址，給 pass2 編碼時使用
+
+    def address(self, symbol):
+        if symbol not in self.symbols: # 宣告變數
+            self.symbols[symbol] = self.var_top
+            self.var_top += 1
+        return self.symbols[symbol]
+
+class AsmProfile:
+    """
+    組譯過程的統計：各階段時間 (read / optimize / analyze / pass 1 / pass 2 / write)、
+    comp/dest/jump 助憶符號的次數、每個 A 指令符號的次數，以及以標記切開的最大區段。
+    各階段時間是「不含」其中呼叫到的其他階段的時間 (例如 pass 1 不含讀檔時間)。
+    """
+    def __init__(self, top_regions=10):
+        self.timings = Counter()
+        self.comp, self.dest, self.jump = Counter(), Counter(), Counter()
+        self.a_symbols = Counter()
+        self.regions = [] # (標記, 起始位址, 字組數)
+        self.top_regions = top_regions
+        self.words = 0
+        self.labels = 0
+        self.variables = 0
+        self.peephole = None
+        self._stack = []
+
+    def _close(self, name, start):
+        elapsed = time.perf_counter() - start
+        self.timings[name] += elapsed - self._stack.pop()
+        if self._stack:
+            self._stack[-1] += elapsed
+
+    def stage(self, iterable, name):
+        # 包住一個迭代器，把花在取得下一個元素的時間記到 name 階段
+        it = iter(iterable)
+        while True:
+            self._stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self._close(name, start)
+                return
+            self._close(name, start)
+            yield item
+
+    def call(self, name, fn, *args):
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self._close(name, start)
+
+    def scan(self, lines):
+        # 統計指令與區段，原樣 (去掉註解後) 傳給下一個階段
+        region, start = '(start)', 0
+        for line in parse_lines(lines):
+            if line.startswith('('):
+                self.labels += 1
+                if self.words > start:
+                    self.regions.append((region, start, self.words - start))
+                region, start = line[1:-1], self.words
+            else:
+                self.words += 1
+                if line.startswith('@'):
+                    self.a_symbols[line[1:]] += 1
+                else:
+                    dest, comp, jump = parse_c_instruction(line)
+                    self.comp[comp] += 1
+                    self.dest[dest or 'null'] += 1
+                    self.jump[jump or 'null'] += 1
+            yield line
+        if self.words > start:
+            self.regions.append((region, start, self.words - start))
+        self.regions = sorted(self.regions, key=lambda r: -r[2])[:self.top_regions]
+
+    def to_dict(self):
+        return {
+            'words': self.words,
+            'labels': self.labels,
+            'variables': self.variables,
+            'timings_ms': {name: round(t * 1000, 3) for name, t in self.timings.items()},
+            'comp': dict(self.comp.most_common()),
+            'dest': dict(self.dest.most_common()),
+            'jump': dict(self.jump.most_common()),
+            'a_symbols': dict(self.a_symbols.most_common()),
+            'largest_regions': [{'label': l, 'address': a, 'words': n} for l, a, n in self.regions],
+            'peephole': self.peephole,
+        }
+
+def parse_lines(lines):
+    # 一行一行讀，去掉註解與空白，只傳回有程式碼的部分
+    for line in lines:
+        line = line.split('//', 1)[0].strip()
+        if line:
+            yield line
 
 def parse_c_instruction(instruction):
     comp = dest = jump = ''
@@ -12,41 +135,215 @@ def parse_c_instruction(instruction):
         comp, jump = comp.split(';')
     return dest, comp, jump
 
-def translate_a_instruction(instruction):
-    address = int(instruction[1:])
-    binary_address = format(address, '015b')
-    return '0' + binary_address
+def translate_a_instruction(instruction, symbols=None):
+    value = instruction[1:]
+    if value.isdigit():
+        address = int(value)
+    elif symbols is not None:
+        address = symbols.address(value)
+    else:
+        raise SyntaxError(f"unresolved symbol: {instruction}")
+    if address > 0x7FFF: # A 指令最高位元為 0，只能放 15 位元
+        raise SyntaxError(f"address out of range (0..32767): {instruction}")
+    return address
 
 def translate_c_instruction(instruction):
-    global code
-    dest, comp, jump = parse_c_instruction(instruction)
-    comp_binary = '111' + code.comp(comp) + code.dest(dest) + code.jump(jump)
-    return comp_binary
-
-def assemble(assembly_code):
-    machine_code = []
-    for line in assembly_code:
-        line = line.strip()
-        if not line or line.startswith('//'):
+    return encode_c_instruction(instruction)
+
+def to_binary(word):
+    return format(word, '016b')
+
+def pass1(lines, symbols):
+    # 第一輪：只記錄 (LABEL) 的位址，不產生機器碼
+    address = 0
+    for line in parse_lines(lines):
+        if line.startswith('('):
+            symbols.add_label(line[1:-1], address)
+        else:
+            address += 1
+    return symbols
+
+def pass2(lines, symbols):
+    # 第二輪：逐行編碼，遇到變數時由符號表配置位址
+    for line in parse_lines(lines):
+        if line.startswith('('):
             continue
         if line.startswith('@'):
-            machine_code.append(translate_a_instruction(line))
+            yield translate_a_instruction(line, symbols)
+        else:
+            yield translate_c_instruction(line)
+
+def assemble_stream(open_source, optimize=False, stats=None, profile=None):
+    # open_source() 每次呼叫都要傳回一個新的行迭代器，兩輪各讀一次來源
+    symbols = SymbolTable()
+    if profile is None:
+        if optimize: # 先經過 peephole 最佳化 (見 peephole.py)，兩輪看到的程式碼相同
+            import peephole
+            threads = peephole.jump_threads(open_source())
+            pass1(peephole.optimize(open_source(), threads), symbols)
+            yield from pass2(peephole.optimize(open_source(), threads, stats), symbols)
+            return
+        pass1(open_source(), symbols)
+        yield from pass2(open_source(), symbols)
+        return
+    # 同樣的流程，但每個階段都包上 profile 計時，並在 pass 1 之前統計指令
+    source = lambda: profile.stage(open_source(), 'read')
+    if optimize:
+        import peephole
+        stats = stats if stats is not None else peephole.PeepholeStats()
+        threads = profile.call('optimize', peephole.jump_threads, source())
+        source1 = profile.stage(peephole.optimize(source(), threads), 'optimize')
+        source2 = profile.stage(peephole.optimize(source(), threads, stats), 'optimize')
+    else:
+        source1, source2 = source(), source()
+    profile.call('pass 1', pass1, profile.stage(profile.scan(source1), 'analyze'), symbols)
+    yield from profile.stage(pass2(source2, symbols), 'pass 2')
+    profile.variables = symbols.var_top - VAR_BASE
+    if optimize:
+        profile.peephole = {'words_in': stats.words_in, 'words_out': stats.words_out, 'saved': stats.saved}
+
+def read_lines(filename):
+    with open(filename, 'r', encoding='utf-8') as f:
+        yield from f
+
+def assemble_file(filename, optimize=False, stats=None, profile=None):
+    return assemble_stream(lambda: read_lines(filename), optimize, stats, profile)
+
+def assemble_words(assembly_code, optimize=False, stats=None):
+    # 兩輪都要從頭讀一次，generator 或檔案這種只能走一遍的迭代器第二輪會是空的
+    if iter(assembly_code) is assembly_code:
+        raise TypeError("assembly_code must be a sequence of lines; "
+                        "use assemble_file() or assemble_stream() for one-shot iterators")
+    return list(assemble_stream(lambda: iter(assembly_code), optimize, stats))
+
+def assemble(assembly_code, optimize=False):
+    return [to_binary(word) for word in assemble_words(assembly_code, optimize)]
+
+# 每個位元組對應的 8 個 '0'/'1' 字元，輸出 .hack 時查表，不必每個字組產生一個字串
+BYTE_BITS = [format(b, '08b').encode('ascii') for b in range(256)]
+
+def to_array(words):
+    return words if isinstance(words, array) else array('H', words)
+
+def bin_bytes(words):
+    # .bin 為 little-endian 的 uint16 (與 vm.c / dasm.c 的 fread 相同)
+    rom = array('H', to_array(words))
+    if sys.byteorder != 'little':
+        rom.byteswap()
+    return rom.tobytes()
+
+def hack_bytes(words):
+    rom = to_array(words)
+    text = bytearray(17 * len(rom))
+    for i, word in enumerate(rom):
+        p = 17 * i
+        text[p:p+8] = BYTE_BITS[word >> 8]
+        text[p+8:p+16] = BYTE_BITS[word & 0xFF]
+        text[p+16] = 0x0A # '\n'
+    return text
+
+def write_bin(words, filename):
+    with open(filename, 'wb') as f:
+        f.write(bin_bytes(words))
+
+def write_hack(words, filename):
+    with open(filename, 'wb') as f:
+        f.write(hack_bytes(words))
+
+def assemble_to(asm_file, hack_file=None, bin_file=None, optimize=False, stats=None, profile=None):
+    # 組譯 asm_file，一次寫出 .hack 文字檔和 .bin 二進位檔 (如 asm.cpp 的 assemble)
+    base = asm_file[:-4] if asm_file.endswith('.asm') else asm_file
+    rom = array('H', assemble_file(asm_file, optimize, stats, profile))
+    if profile is None:
+        write_hack(rom, hack_file or base + '.hack')
+        write_bin(rom, bin_file or base + '.bin')
+    else:
+        profile.call('write', write_hack, rom, hack_file or base + '.hack')
+        profile.call('write', write_bin, rom, bin_file or base + '.bin')
+    return rom
+
+CACHE_VERSION = b'hack-asm-1' # 組譯器輸出格式改變時要更新，讓舊快取失效
+
+def source_hash(asm_file, optimize=False):
+    h = hashlib.sha256(CACHE_VERSION + (b'-O' if optimize else b''))
+    with open(asm_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def assemble_job(asm_file, cache_dir=None, optimize=False, profile=False):
+    # 單一檔案的工作 (在 process pool 中執行)，傳回 (檔名, 狀態, 指令數, 統計)
+    # 統計只有在 profile 為 True 且真的重新組譯時才有，否則為 None
+    base = asm_file[:-4] if asm_file.endswith('.asm') else asm_file
+    hack_file, bin_file = base + '.hack', base + '.bin'
+    prof = AsmProfile() if profile else None
+    if cache_dir is None:
+        rom = assemble_to(asm_file, hack_file, bin_file, optimize, profile=prof)
+        return asm_file, 'assembled', len(rom), prof and prof.to_dict()
+    key = os.path.join(cache_dir, source_hash(asm_file, optimize))
+    if os.path.exists(key + '.hack') and os.path.exists(key + '.bin'):
+        shutil.copyfile(key + '.hack', hack_file)
+        shutil.copyfile(key + '.bin', bin_file)
+        return asm_file, 'cached', os.path.getsize(bin_file) // 2, None
+    rom = assemble_to(asm_file, hack_file, bin_file, optimize, profile=prof)
+    # 先寫到暫存檔再改名，避免平行工作讀到寫一半的快取
+    for ext, src in (('.hack', hack_file), ('.bin', bin_file)):
+        tmp = f'{key}{ext}.{os.getpid()}'
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, key + ext)
+    return asm_file, 'assembled', len(rom), prof and prof.to_dict()
+
+def find_asm_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith('.asm'):
+                        yield os.path.join(root, name)
         else:
-            machine_code.append(translate_c_instruction(line))
-    return machine_code
+            yield path
 
-# Example usage:
-assembly_code = [
-    '@2',
-    'D=A',
-    '@3',
-    'D=D+A',
-    '@0',
-    'M=D',
-]
+def assemble_all(paths, cache_dir=None, jobs=None, optimize=False, profile=False):
+    files = list(find_asm_files(paths))
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+    if jobs == 1 or len(files) <= 1:
+        return [assemble_job(f, cache_dir, optimize, profile) for f in files]
+    n = len(files)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(assemble_job, files, [cache_dir] * n, [optimize] * n, [profile] * n))
 
-machine_code = assemble(assembly_code)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Hack 組譯器: 將 .asm 組譯為 .hack 與 .bin')
+    parser.add_argument('paths', nargs='+', help='.asm 檔案或資料夾 (資料夾會遞迴尋找 .asm)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='平行的 process 數 (預設為 CPU 數)')
+    parser.add_argument('--cache-dir', default='.asm_cache', help='組譯結果快取資料夾 (預設 .asm_cache)')
+    parser.add_argument('--no-cache', action='store_true', help='不使用快取，全部重新組譯')
+    parser.add_argument('-O', '--optimize', action='store_true', help='組譯前先做 peephole 最佳化 (見 peephole.py)')
+    parser.add_argument('--stats', nargs='?', const='-', metavar='FILE',
+                        help='輸出每個檔案的組譯統計 JSON 到 FILE (省略則印到螢幕)；使用快取的檔案沒有統計')
+    args = parser.parse_args(argv)
 
-for i in range(len(machine_code)):
-    print(f"{machine_code[i]}\t{assembly_code[i]}")
+    cache_dir = None if args.no_cache else args.cache_dir
+    try:
+        results = assemble_all(args.paths, cache_dir, args.jobs, args.optimize, args.stats is not None)
+    except (OSError, SyntaxError, KeyError) as e:
+        print(f"組譯時發生錯誤: {type(e).__name__}: {e}")
+        return 1
+    if args.stats is not None:
+        report = json.dumps({asm_file: prof for asm_file, _, _, prof in results}, indent=2, ensure_ascii=False)
+        if args.stats == '-':
+            print(report)
+        else:
+            with open(args.stats, 'w', encoding='utf-8') as f:
+                f.write(report + '\n')
+    if args.stats != '-':
+        for asm_file, status, size, _ in results:
+            print(f"{status:<10} {size:>6} {asm_file}")
+        cached = sum(1 for _, status, _, _ in results if status == 'cached')
+        print(f"共 {len(results)} 個檔案，{cached} 個使用快取")
+    return 0
 
+if __name__ == '__main__':
+    sys.exit(main())
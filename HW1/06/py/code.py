@@ -1,52 +1,125 @@
+from functools import lru_cache
+
+DEST = {
+    '':   0b000,
+    'M':  0b001,
+    'D':  0b010,
+    'MD': 0b011,
+    'A':  0b100,
+    'AM': 0b101,
+    'AD': 0b110,
+    'AMD':0b111,
+}
+
+COMP = { # a + c1..c6
+    '0':   0b0101010,
+    '1':   0b0111111,
+    '-1':  0b0111010,
+    'D':   0b0001100,
+    'A':   0b0110000,
+    '!D':  0b0001101,
+    '!A':  0b0110001,
+    '-D':  0b0001111,
+    '-A':  0b0110011,
+    'D+1': 0b0011111,
+    'A+1': 0b0110111,
+    'D-1': 0b0001110,
+    'A-1': 0b0110010,
+    'D+A': 0b0000010,
+    'D-A': 0b0010011,
+    'A-D': 0b0000111,
+    'D&A': 0b0000000,
+    'D|A': 0b0010101,
+    'M':   0b1110000,
+    '!M':  0b1110001,
+    '-M':  0b1110011,
+    'M+1': 0b1110111,
+    'M-1': 0b1110010,
+    'D+M': 0b1000010,
+    'D-M': 0b1010011,
+    'M-D': 0b1000111,
+    'D&M': 0b1000000,
+    'D|M': 0b1010101,
+}
+
+JUMP = {
+    '':   0b000,
+    'JGT':0b001,
+    'JEQ':0b010,
+    'JGE':0b011,
+    'JLT':0b100,
+    'JNE':0b101,
+    'JLE':0b110,
+    'JMP':0b111,
+}
+
+C_PREFIX = 0b111 << 13
+
+def c_word(dest, comp, jump):
+    return C_PREFIX | COMP[comp] << 6 | DEST[dest] << 3 | JUMP[jump]
+
+def c_text(dest, comp, jump):
+    text = f'{dest}={comp}' if dest else comp
+    return f'{text};{jump}' if jump else text
+
+# 所有合法 C 指令全文 (dest=comp;jump) 對應的 16 位元整數，載入時建一次
+C_INSTRUCTIONS = {
+    c_text(d, c, j): c_word(d, c, j)
+    for d in DEST for c in COMP for j in JUMP
+}
+
+def _dest_bits(dest):
+    # 允許 DM, MA 之類的順序，依 A D M 三個暫存器各自的位元組合
+    if len(set(dest)) != len(dest) or not set(dest) <= set('AMD'):
+        raise KeyError(dest)
+    return sum(DEST[r] for r in dest)
+
+def _normalize_comp(comp):
+    # 可交換的運算 (A+D, M&D ...) 換成表中的順序
+    if comp in COMP:
+        return comp
+    for op in '+&|':
+        if op in comp:
+            left, right = comp.split(op, 1)
+            swapped = right + op + left
+            if swapped in COMP:
+                return swapped
+    raise KeyError(comp)
+
+@lru_cache(maxsize=4096)
+def _encode_unseen(instruction):
+    comp = dest = jump = ''
+    text = instruction.replace(' ', '').replace('\t', '')
+    if '=' in text:
+        dest, text = text.split('=', 1)
+    if ';' in text:
+        comp, jump = text.split(';', 1)
+    else:
+        comp = text
+    return C_PREFIX | COMP[_normalize_comp(comp)] << 6 | _dest_bits(dest) << 3 | JUMP[jump]
+
+def encode_c_instruction(instruction):
+    word = C_INSTRUCTIONS.get(instruction)
+    if word is None: # 不在預先算好的表中，交給有快取的解析
+        word = _encode_unseen(instruction)
+    return word
+
 class Code:
     @staticmethod
     def dest(mnemonic):
-        return {
-            '':   '000',
-            'M':  '001',
-            'D':  '010',
-            'MD': '011',
-            'A':  '100',
-            'AM': '101',
-            'AD': '110',
-            'AMD':'111',
-        }[mnemonic]
+        return format(DEST[mnemonic], '03b')
 
     @staticmethod
     def comp(mnemonic):
-        return {
-            '0':   '0101010',
-            '1':   '0111111',
-            '-1':  '0111010',
-            'D':   '0001100',
-            'A':   '0110000',
-            '!D':  '0001101',
-            '!A':  '0110001',
-            '-D':  '0001111',
-            '-A':  '0110011',
-            'D+1': '0011111',
-            'A+1': '0110111',
-            'D-1': '0001110',
-            'A-1': '0110010',
-            'D+A': '0000010',
-            'D-A': '0010011',
-            'A-D': '0000111',
-            'D&A': '0000000',
-            'D|A': '0010101',
-        }[mnemonic]
+        return format(COMP[mnemonic], '07b')
 
     @staticmethod
     def jump(mnemonic):
-        return {
-            '':   '000',
-            'JGT':'001',
-            'JEQ':'010',
-            'JGE':'011',
-            'JLT':'100',
-            'JNE':'101',
-            'JLE':'110',
-            'JMP':'111',
-        }[mnemonic]
+        return format(JUMP[mnemonic], '03b')
+
+    @staticmethod
+    def encode(instruction):
+        return encode_c_instruction(instruction)
 
 if __name__ == '__main__':
     # Example usage:
@@ -54,3 +127,4 @@ if __name__ == '__main__':
     print(code.dest('D'))  # Output: '010'
     print(code.comp('A+1'))  # Output: '0110111'
     print(code.jump('JGT'))  # Output: '001'
+    print(format(code.encode('D=D+A'), '016b'))  # Output: '1110000010010000'
@@ -0,0 +1,80 @@
+import sys
+import time
+
+import numpy as np
+
+import asm
+from code import COMP, DEST, JUMP
+from vm import load_rom
+
+def inverse(table, size, fmt='%s'):
+    # code.py 編碼表的反查表 (numpy object 陣列，可以用欄位值陣列直接索引)
+    names = np.full(size, None, dtype=object)
+    for mnemonic, bits in table.items():
+        names[bits] = fmt % mnemonic if mnemonic else ''
+    return names
+
+COMP_NAME = inverse(COMP, 128)        # 索引為 a c1..c6
+DEST_NAME = inverse(DEST, 8, '%s=')   # 'D=', 'AM=' ...
+JUMP_NAME = inverse(JUMP, 8, ';%s')   # ';JGT' ...
+
+def rom_array(rom):
+    """把 ROM (array('H')、list 或檔名) 轉成 numpy uint16 陣列"""
+    if isinstance(rom, str):
+        rom = load_rom(rom)
+    return np.asarray(rom, dtype=np.uint16)
+
+def fields(rom):
+    """一次取出所有指令的 a, comp, dest, jump 欄位 (numpy 向量運算)"""
+    rom = rom_array(rom)
+    is_c = (rom & 0x8000) != 0
+    a = (rom >> 12) & 1
+    comp = (rom >> 6) & 0x3F
+    dest = (rom >> 3) & 0x7
+    jump = rom & 0x7
+    return is_c, a, comp, dest, jump
+
+def disassemble(rom):
+    """傳回每個字組對應的組合語言字串 list (與 dasm.c 的輸出相同)"""
+    rom = rom_array(rom)
+    is_c, a, comp, dest, jump = fields(rom)
+    comp_name = COMP_NAME[a << 6 | comp]
+    bad = is_c & (((rom & 0xE000) != 0xE000) | (comp_name == None))
+    if bad.any():
+        pc = int(np.flatnonzero(bad)[0])
+        raise ValueError(f"invalid C instruction {int(rom[pc]):04X} at {pc}")
+    text = np.empty(len(rom), dtype=object)
+    text[is_c] = DEST_NAME[dest[is_c]] + comp_name[is_c] + JUMP_NAME[jump[is_c]]
+    text[~is_c] = ['@%d' % value for value in rom[~is_c].tolist()]
+    return text.tolist()
+
+def roundtrip(assembly_code):
+    """
+    assemble -> disassemble -> assemble，確認兩次組譯的機器碼完全相同。
+    傳回 (是否相同, 第一個不同的位址或 None, 指令數)。
+    """
+    first = np.array(asm.assemble_words(assembly_code), dtype=np.uint16)
+    second = np.array(asm.assemble_words(disassemble(first)), dtype=np.uint16)
+    if len(first) == len(second) and np.array_equal(first, second):
+        return True, None, len(first)
+    diff = np.flatnonzero(first[:len(second)] != second[:len(first)])
+    pc = int(diff[0]) if len(diff) else min(len(first), len(second))
+    return False, pc, len(first)
+
+# run: python dasm.py <file.bin|file.hack>
+#      python dasm.py --check <file.asm>
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("用法: python dasm.py <file.bin|file.hack>")
+        print("      python dasm.py --check <file.asm>  (組譯 -> 反組譯 -> 組譯 的驗證)")
+        sys.exit(1)
+    if sys.argv[1] == '--check':
+        for filename in sys.argv[2:]:
+            start = time.perf_counter()
+            ok, pc, size = roundtrip(list(asm.read_lines(filename)))
+            elapsed = (time.perf_counter() - start) * 1000
+            status = 'ok' if ok else f'FAIL at {pc}'
+            print(f"{status:<12} {size:>6} words {elapsed:8.2f} ms  {filename}")
+    else:
+        for line in disassemble(sys.argv[1]):
+            print(line)
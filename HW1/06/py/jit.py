@@ -0,0 +1,163 @@
+import sys
+import time
+
+from vm import Computer, alu_function, load_rom
+
+MAX_BLOCK = 256 # 一個區塊最多編譯幾個指令
+
+# ALU 的 c1..c6 對應的 Python 運算式，X 會換成 A、常數或 ram[...]
+COMP_EXPR = {
+    0x2A: '0',
+    0x3F: '1',
+    0x3A: '65535',
+    0x0C: 'D',
+    0x30: 'X',
+    0x0D: 'D ^ 65535',
+    0x31: 'X ^ 65535',
+    0x0F: '-D & 65535',
+    0x33: '-X & 65535',
+    0x1F: '(D + 1) & 65535',
+    0x37: '(X + 1) & 65535',
+    0x0E: '(D - 1) & 65535',
+    0x32: '(X - 1) & 65535',
+    0x02: '(D + X) & 65535',
+    0x13: '(D - X) & 65535',
+    0x07: '(X - D) & 65535',
+    0x00: 'D & X',
+    0x15: 'D | X',
+}
+
+# 跳躍條件 (值以無號 16 位元表示，>= 32768 代表負數)
+JUMP_COND = {
+    1: '0 < o < 32768',     # JGT
+    2: 'o == 0',            # JEQ
+    3: 'o < 32768',         # JGE
+    4: 'o >= 32768',        # JLT
+    5: 'o != 0',            # JNE
+    6: 'o == 0 or o >= 32768', # JLE
+}
+
+def compile_block(rom, entry, halts=()):
+    """
+    把從 entry 開始的一段直線程式碼翻譯成 Python 函數 block(ram, A, D)，
+    傳回 (A, D, 下一個 PC, 執行的指令數)。
+
+    條件跳躍在區塊中間變成提早 return (side exit)，區塊在無條件跳躍、
+    ROM 結尾或 MAX_BLOCK 個指令處結束。A 的值若在編譯時已知 (@value 之後)，
+    就直接以常數存取 ram，不經過 A 變數。
+    """
+    lines = [f'def block(ram, A, D):']
+    env = {}
+    known = None # 編譯時已知的 A 值
+    pc, top = entry, len(rom)
+    count = 0
+    while pc < top:
+        word = rom[pc]
+        pc += 1
+        count += 1
+        if word & 0x8000 == 0: # A 指令
+            known = word
+            lines.append(f'    A = {word}')
+        else:
+            a = (word >> 12) & 1
+            c = (word >> 6) & 0x3F
+            d = (word >> 3) & 0x7
+            j = word & 0x7
+            addr = 'A' if known is None else str(known)
+            x = f'ram[{addr}]' if a else addr
+            if c in COMP_EXPR:
+                expr = COMP_EXPR[c].replace('X', x)
+            else:
+                env[f'alu_{c:02X}'] = alu_function(c)
+                expr = f'alu_{c:02X}(D, {x})'
+            target = addr
+            if d & 4 and j and known is None: # 跳躍目標是執行前的 A
+                lines.append('    t = A')
+                target = 't'
+            if j == 0 and d in (1, 2, 4):
+                dest = {1: f'ram[{addr}]', 2: 'D', 4: 'A'}[d]
+                lines.append(f'    {dest} = {expr}')
+            else:
+                lines.append(f'    o = {expr}')
+                if d & 1: lines.append(f'    ram[{addr}] = o') # 寫入 M 用的是執行前的 A
+                if d & 2: lines.append('    D = o')
+                if d & 4: lines.append('    A = o')
+            if d & 4:
+                known = None
+            if j == 7:
+                lines.append(f'    return A, D, {target}, {count}')
+                break
+            if j:
+                lines.append(f'    if {JUMP_COND[j]}: return A, D, {target}, {count}')
+        # 區塊太長就在這裡切開，但不能剛好停在結束迴圈的入口 (見 JitComputer.run)
+        if count >= MAX_BLOCK and pc not in halts:
+            break
+    lines.append(f'    return A, D, {pc}, {count}')
+    source = '\n'.join(lines) + '\n'
+    exec(compile(source, f'<hack block {entry}>', 'exec'), env)
+    return env['block'], count, source
+
+class JitComputer(Computer):
+    """以基本區塊為單位把 ROM 編譯成 Python 函數執行的 Computer"""
+
+    def load(self, rom):
+        super().load(rom)
+        self.blocks = {} # entry PC -> (function, 指令數)，ROM 不會變，所以不需要失效
+
+    def block(self, entry):
+        block = self.blocks.get(entry)
+        if block is None:
+            fn, count, _ = compile_block(self.rom, entry, self.halts)
+            block = self.blocks[entry] = (fn, count)
+        return block
+
+    def run(self, max_steps=None):
+        ram, halts, blocks = self.ram, self.halts, self.blocks
+        top = len(self.rom)
+        A, D, PC = self.A, self.D, self.PC
+        limit = float('inf') if max_steps is None else max_steps
+        steps = 0
+        while PC < top and steps < limit:
+            block = blocks.get(PC) or self.block(PC)
+            if limit - steps < block[1]:
+                # 剩下的指令不夠跑完整個區塊，改用逐步執行補足
+                self.A, self.D, self.PC = A, D, PC
+                self.steps += steps
+                return steps + Computer.run(self, limit - steps)
+            A, D, PC, n = block[0](ram, A, D)
+            steps += n
+            if PC in halts: break
+        self.A, self.D, self.PC = A, D, PC
+        self.steps += steps
+        return steps
+
+def benchmark(rom, ram_init=None, max_steps=None, repeat=3):
+    """在同一個程式上比較逐步執行 (Computer) 與區塊編譯 (JitComputer) 的速度"""
+    results = {}
+    for cls in (Computer, JitComputer):
+        best = None
+        for _ in range(repeat):
+            computer = cls(rom)
+            for address, value in (ram_init or {}).items():
+                computer.ram[address] = value
+            start = time.perf_counter()
+            steps = computer.run(max_steps)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[cls.__name__] = (steps, best, computer.ram[:16])
+    return results
+
+# run: python jit.py <file.asm|file.hack|file.bin> [max_steps] [address=value ...]
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("用法: python jit.py <file.asm|file.hack|file.bin> [max_steps] [address=value ...]")
+        sys.exit(1)
+    max_steps = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    ram_init = dict(map(int, arg.split('=')) for arg in sys.argv[3:])
+    results = benchmark(load_rom(sys.argv[1]), ram_init, max_steps)
+    base = results['Computer'][1]
+    for name, (steps, elapsed, regs) in results.items():
+        print(f"{name:<12} steps={steps} time={elapsed:.4f}s "
+              f"{steps / elapsed / 1e6:.2f} M instructions/sec speedup={base / elapsed:.2f}x")
+    if results['Computer'][2] != results['JitComputer'][2]:
+        print("警告: 兩種執行方式的 RAM[0..15] 結果不同！")
@@ -0,0 +1,214 @@
+import re
+import sys
+from collections import deque
+
+import asm
+from vm import Computer
+
+WINDOW = 16 # 最多保留幾個指令等待改寫，超過就直接輸出
+
+class PeepholeStats:
+    def __init__(self):
+        self.words_in = 0
+        self.saved = {} # 規則名稱 -> 省下的字組數
+        self.rewrites = {} # 規則名稱 -> 套用次數
+
+    def hit(self, rule, words=1):
+        self.saved[rule] = self.saved.get(rule, 0) + words
+        self.rewrites[rule] = self.rewrites.get(rule, 0) + 1
+
+    @property
+    def words_saved(self):
+        return sum(self.saved.values())
+
+    @property
+    def words_out(self):
+        return self.words_in - self.words_saved
+
+    def report(self):
+        lines = [f"{self.words_in} -> {self.words_out} words (saved {self.words_saved})"]
+        for rule, words in sorted(self.saved.items(), key=lambda item: -item[1]):
+            lines.append(f"  {rule:<16} {words:>6} words {self.rewrites[rule]:>6} rewrites")
+        return '\n'.join(lines)
+
+def canonical(symbol):
+    # @SP、@R0、@0 都是同一個位址
+    value = asm.PREDEFINED_SYMBOLS.get(symbol)
+    return str(value) if value is not None else symbol
+
+SP = canonical('SP')
+
+def jump_threads(lines):
+    """
+    找出開頭就是 @M / 0;JMP 的標記 L，傳回 {L: 最終目標}，
+    讓 @L / 0;JMP 可以直接跳到最後的目標 (jump-to-jump threading)。
+    """
+    direct = {}
+    labels, load = [], None
+    for line in asm.parse_lines(lines):
+        if line.startswith('('):
+            if load is not None:
+                labels, load = [], None
+            labels.append(line[1:-1])
+        elif line.startswith('@') and labels and load is None:
+            load = line[1:]
+        else:
+            if load is not None:
+                dest, _, jump = asm.parse_c_instruction(line)
+                if not dest and jump == 'JMP':
+                    for label in labels:
+                        direct[label] = load
+            labels, load = [], None
+    threads = {}
+    for label in direct:
+        target, seen = label, {label}
+        while target in direct and direct[target] not in seen:
+            target = direct[target]
+            seen.add(target)
+        if target != label:
+            threads[label] = target
+    return threads
+
+def optimize(lines, threads=None, stats=None):
+    """
+    對組合語言做滑動視窗的 peephole 改寫，逐行讀入、逐行產生，規則如下：
+
+    * redundant-load: A 已經等於 X 時，省略 @X
+    * inc-dec:        M=M+1 接 AM=M-1 改成 A=M；M=M+1 接 M=M-1 直接刪掉
+    * sp-reload:      @SP / A=M 之後 A 沒變，再一次 @SP / A=M 可以省略
+                      (假設 SP 不會指向 RAM[0] 自己)
+    * store-load:     M=D 之後馬上 D=M (同一個位址) 可以省略
+    * dead-d:         D 被覆寫之前都沒被讀過，前一次 D=... 可以刪掉
+    * jump-thread:    @L / 0;JMP 而 L 又是 @M / 0;JMP，直接跳到 M
+
+    標記 (LABEL) 是改寫的邊界，程式只能經由標記跳躍 (不能跳到數字位址)。
+    """
+    threads = threads or {}
+    stats = stats if stats is not None else PeepholeStats()
+    out = deque() # (指令, 指令執行前 A 的狀態)
+    a = None      # A 的已知值：('@', X) 代表 A == X，('*', X) 代表 A == RAM[X]
+    for line in asm.parse_lines(lines):
+        if line.startswith('('):
+            while out:
+                yield out.popleft()[0]
+            a = None
+            yield line
+            continue
+        stats.words_in += 1
+        queue = [line]
+        while queue:
+            line = queue.pop()
+            if line.startswith('@'):
+                symbol = canonical(line[1:])
+                if a == ('@', symbol):
+                    stats.hit('redundant-load')
+                    continue
+                out.append((line, a))
+                a = ('@', symbol)
+                continue
+            dest, comp, jump = asm.parse_c_instruction(line)
+            last = out[-1][0] if out else None
+            if line == 'A=M' and last is not None and last.startswith('@'):
+                symbol, before = canonical(last[1:]), out[-1][1]
+                if symbol == SP and before == ('*', SP):
+                    out.pop()
+                    a = before
+                    stats.hit('sp-reload', 2)
+                    continue
+            if last == 'M=M+1' and line in ('AM=M-1', 'M=M-1'):
+                out.pop()
+                if line == 'AM=M-1':
+                    queue.append('A=M')
+                    stats.hit('inc-dec', 1)
+                else:
+                    stats.hit('inc-dec', 2)
+                continue
+            if last == 'M=D' and line == 'D=M':
+                stats.hit('store-load')
+                continue
+            if jump == 'JMP' and not dest and 'A' not in comp and 'M' not in comp \
+                    and last is not None and last.startswith('@') and last[1:] in threads:
+                target = threads[last[1:]]
+                out[-1] = ('@' + target, out[-1][1])
+                a = ('@', canonical(target))
+                stats.hit('jump-thread', 0)
+            if dest == 'D' and not jump and 'D' not in comp:
+                _remove_dead_d(out, stats)
+            if line == 'A=M' and a is not None and a[0] == '@':
+                a = ('*', a[1])
+            elif 'A' in dest:
+                a = None
+            elif 'M' in dest and a is not None and a[0] == '*' and a[1] != SP:
+                a = None
+            out.append((line, a))
+            if len(out) > WINDOW:
+                yield out.popleft()[0]
+    while out:
+        yield out.popleft()[0]
+
+def _remove_dead_d(out, stats):
+    # 往回找上一個寫入 D 的指令，中間沒有讀 D 也沒有跳躍的話，它的結果沒人用
+    for i in range(len(out) - 1, -1, -1):
+        line = out[i][0]
+        if line.startswith('@'):
+            continue
+        dest, comp, jump = asm.parse_c_instruction(line)
+        if jump:
+            return
+        if 'D' in dest:
+            if dest == 'D':
+                del out[i]
+                stats.hit('dead-d')
+            return
+        if 'D' in comp:
+            return
+
+def read_tst(asm_file):
+    """
+    從同名 .tst 讀出 set RAM[i] v 的初始值，以及 output-list 要比對的 RAM 位址。
+    沒有 .tst 時傳回 ({}, None)，代表比對整個 RAM。
+    """
+    tst_file = asm_file[:-4] + '.tst'
+    try:
+        with open(tst_file, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except OSError:
+        return {}, None
+    setup = {int(i): int(v) & 0xFFFF for i, v in re.findall(r'set\s+RAM\[(\d+)\]\s+(-?\d+)', text)}
+    outputs = None
+    match = re.search(r'output-list([^;]*);', text)
+    if match:
+        outputs = [int(i) for i in re.findall(r'RAM\[(\d+)\]', match.group(1))]
+    return setup, outputs
+
+def check(asm_file, max_steps=10_000_000):
+    """
+    回歸測試：原始程式與最佳化後的程式分別在模擬器上執行到結束，
+    比較 .tst 的 output-list 位址 (沒有 .tst 就比對整個 RAM) 是否相同。
+    RAM 中存放的返回位址 (ROM 位址) 本來就會因為程式變短而不同，所以不能全部比對。
+    傳回 (是否相同, stats, 兩者執行的指令數)。
+    """
+    setup, outputs = read_tst(asm_file)
+    stats = PeepholeStats()
+    results = []
+    for rom in (asm.assemble_file(asm_file), asm.assemble_file(asm_file, True, stats)):
+        computer = Computer(rom)
+        for address, value in setup.items():
+            computer.ram[address] = value
+        steps = computer.run(max_steps)
+        ram = computer.ram.tolist()
+        results.append(([ram[i] for i in outputs] if outputs is not None else ram, steps))
+    return results[0][0] == results[1][0], stats, (results[0][1], results[1][1])
+
+# run: python peephole.py <file.asm> ...   (最佳化並以模擬器比對結果)
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("用法: python peephole.py <file.asm> ...")
+        sys.exit(1)
+    failed = 0
+    for filename in sys.argv[1:]:
+        same, stats, (before, after) = check(filename)
+        failed += not same
+        print(f"{'ok' if same else 'FAIL':<5} {stats.words_in:>6} -> {stats.words_out:<6} words, "
+              f"{before:>8} -> {after:<8} steps  {filename}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,74 @@
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+from jit import JitComputer
+from vm import SCREEN, SCREEN_SIZE, load_rom
+
+WIDTH, HEIGHT = 512, 256
+
+def ram_array(ram):
+    """整個 RAM 的 numpy int16 view (不複製，寫入會直接改到模擬器的 RAM)"""
+    return np.frombuffer(ram, dtype=np.int16)
+
+def screen_array(ram):
+    """螢幕區 RAM[16384..24575] 的 numpy uint16 view (不複製)"""
+    return np.frombuffer(ram, dtype='<u2', count=SCREEN_SIZE, offset=2 * SCREEN)
+
+def frame(ram):
+    """
+    將螢幕區一次展開為 256x512 的 0/1 陣列 (1 為黑點)。
+    Hack 螢幕每個字組的最低位元是最左邊的點，所以用 little 位元順序展開。
+    """
+    pixels = np.unpackbits(screen_array(ram).view(np.uint8), bitorder='little')
+    return pixels.reshape(HEIGHT, WIDTH)
+
+def write_pbm(ram, filename):
+    # PBM (P4) 也是 1 為黑點，每列由最高位元開始
+    rows = np.packbits(frame(ram), axis=1)
+    with open(filename, 'wb') as f:
+        f.write(b'P4\n%d %d\n' % (WIDTH, HEIGHT) + rows.tobytes())
+
+def write_png(ram, filename):
+    # 1 位元灰階 PNG：0 為黑，所以要反相；每列前面加上 filter type 0
+    rows = np.packbits(frame(ram) ^ 1, axis=1)
+    raw = np.hstack([np.zeros((HEIGHT, 1), dtype=np.uint8), rows]).tobytes()
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data)))
+    header = struct.pack('>IIBBBBB', WIDTH, HEIGHT, 1, 0, 0, 0, 0)
+    with open(filename, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+                + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+
+def dump_frames(computer, every, count, pattern='frame%04d.png'):
+    """
+    每執行 every 個指令就把螢幕存成一張圖，最多 count 張。
+    CPU 迴圈本身不做任何檢查，只是分段呼叫 run()，所以不會變慢。
+    """
+    write = write_png if pattern.endswith('.png') else write_pbm
+    files = []
+    for i in range(count):
+        steps = computer.run(every)
+        files.append(pattern % i)
+        write(computer.ram, files[-1])
+        if steps < every: # 程式已經結束
+            break
+    return files
+
+# run: python screen.py <file.asm|file.hack|file.bin> <every> <count> [pattern] [address=value ...]
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print("用法: python screen.py <file.asm|file.hack|file.bin> <every> <count> [pattern] [address=value ...]")
+        print("範例: python screen.py Fill.asm 100000 5 fill%02d.png 24576=1")
+        sys.exit(1)
+    args = sys.argv[4:]
+    pattern = args.pop(0) if args and '=' not in args[0] else 'frame%04d.png'
+    computer = JitComputer(load_rom(sys.argv[1]))
+    for arg in args:
+        address, value = map(int, arg.split('='))
+        computer.ram[address] = value & 0xFFFF
+    for name in dump_frames(computer, int(sys.argv[2]), int(sys.argv[3]), pattern):
+        print(name)
@@ -0,0 +1,169 @@
+import sys
+import time
+from array import array
+
+import asm
+
+RAM_SIZE = 65536
+ROM_SIZE = 32768
+SCREEN = 16384 # 螢幕記憶體映射 RAM[16384..24575]，512x256 像素，每個字組 16 點
+SCREEN_SIZE = 8192
+KBD = 24576    # 鍵盤記憶體映射
+MASK = 0xFFFF
+
+# ALU 的 c1..c6 (與 vm.c 的 switch 相同)，X 為 A 或 M (由 a 位元決定)
+# 所有值都以 0..65535 的無號整數保存，負數用二補數表示
+ALU = {
+    0x2A: lambda D, X: 0,                    # "0"
+    0x3F: lambda D, X: 1,                    # "1"
+    0x3A: lambda D, X: MASK,                 # "-1"
+    0x0C: lambda D, X: D,                    # "D"
+    0x30: lambda D, X: X,                    # "X"
+    0x0D: lambda D, X: D ^ MASK,             # "!D"
+    0x31: lambda D, X: X ^ MASK,             # "!X"
+    0x0F: lambda D, X: -D & MASK,            # "-D"
+    0x33: lambda D, X: -X & MASK,            # "-X"
+    0x1F: lambda D, X: (D + 1) & MASK,       # "D+1"
+    0x37: lambda D, X: (X + 1) & MASK,       # "X+1"
+    0x0E: lambda D, X: (D - 1) & MASK,       # "D-1"
+    0x32: lambda D, X: (X - 1) & MASK,       # "X-1"
+    0x02: lambda D, X: (D + X) & MASK,       # "D+X"
+    0x13: lambda D, X: (D - X) & MASK,       # "D-X"
+    0x07: lambda D, X: (X - D) & MASK,       # "X-D"
+    0x00: lambda D, X: D & X,                # "D&X"
+    0x15: lambda D, X: D | X,                # "D|X"
+}
+
+def alu_function(c):
+    # 非標準的 c 組合：依 zx nx zy ny f no 六個控制位元組出 ALU
+    if c in ALU:
+        return ALU[c]
+    zx, nx, zy, ny, f, no = ((c >> (5 - i)) & 1 for i in range(6))
+    def alu(D, X):
+        x = 0 if zx else D
+        x = x ^ MASK if nx else x
+        y = 0 if zy else X
+        y = y ^ MASK if ny else y
+        out = (x + y) & MASK if f else x & y
+        return out ^ MASK if no else out
+    return alu
+
+def jump_table(j):
+    # 對每個 16 位元的 ALU 輸出預先算好是否跳躍，執行時只要查表
+    table = bytearray(RAM_SIZE)
+    for v in range(RAM_SIZE):
+        lt, eq = v >= 0x8000, v == 0
+        gt = not lt and not eq
+        table[v] = bool((j & 4 and lt) or (j & 2 and eq) or (j & 1 and gt))
+    return bytes(table)
+
+JUMP = [None] + [jump_table(j) for j in range(1, 8)]
+
+def decode(word):
+    """將一個 ROM 字組解碼為 (alu, a, dest, jump)，A 指令為 (None, value, 0, None)"""
+    if word & 0x8000 == 0: # A 指令
+        return (None, word, 0, None)
+    a = (word >> 12) & 1
+    c = (word >> 6) & 0x3F
+    d = (word >> 3) & 0x7
+    j = word & 0x7
+    return (alu_function(c), a, d, JUMP[j])
+
+def load_rom(filename):
+    """讀入 .asm (先組譯)、.hack (文字) 或 .bin (little-endian uint16) 檔"""
+    if filename.endswith('.asm'):
+        return array('H', asm.assemble_file(filename))
+    if filename.endswith('.hack'):
+        with open(filename, 'r', encoding='ascii') as f:
+            return array('H', (int(line, 2) for line in f if line.strip()))
+    rom = array('H')
+    with open(filename, 'rb') as f:
+        rom.frombytes(f.read())
+    if sys.byteorder != 'little':
+        rom.byteswap()
+    return rom
+
+def new_ram():
+    # RAM 放在 bytearray 上，以 uint16 的 memoryview 存取：
+    # CPU 迴圈照樣用整數索引，螢幕區可以零複製地交給 numpy 或寫檔
+    return memoryview(bytearray(2 * RAM_SIZE)).cast('H')
+
+class Computer:
+    def __init__(self, rom=(), ram=None):
+        self.ram = ram if ram is not None else new_ram()
+        self.A = self.D = self.PC = 0
+        self.steps = 0
+        self.load(rom)
+
+    def load(self, rom):
+        self.rom = array('H', rom)
+        if len(self.rom) > ROM_SIZE:
+            raise ValueError(f"program too large: {len(self.rom)} words (ROM is {ROM_SIZE})")
+        self.decoded = [decode(word) for word in self.rom] # 每個字組只解碼一次
+        self.halts = self._scan_halts()
+
+    def _scan_halts(self):
+        # 找出 (END) @END 0;JMP 這種原地無窮迴圈，跳到這裡就視為程式結束
+        halts = set()
+        for pc in range(len(self.rom) - 1):
+            if self.rom[pc] == pc and self.rom[pc + 1] == 0xEA87:
+                halts.add(pc)
+        return halts
+
+    @property
+    def screen(self):
+        # 螢幕區的 view (不複製)，內容會隨 CPU 執行改變
+        return self.ram[SCREEN:SCREEN + SCREEN_SIZE]
+
+    def reset(self):
+        self.A = self.D = self.PC = 0
+        self.steps = 0
+
+    def run(self, max_steps=None):
+        """執行到 PC 超出程式、跳進結束迴圈或執行滿 max_steps 為止，傳回執行的指令數"""
+        decoded, ram, halts = self.decoded, self.ram, self.halts
+        top = len(decoded)
+        A, D, PC = self.A, self.D, self.PC
+        limit = float('inf') if max_steps is None else max_steps
+        steps = 0
+        while PC < top and steps < limit:
+            alu, a, d, jump = decoded[PC]
+            PC += 1
+            steps += 1
+            if alu is None: # A 指令
+                A = a
+                continue
+            out = alu(D, ram[A] if a else A)
+            if d:
+                if d & 1: ram[A] = out # M 寫入的位址是執行前的 A
+                if d & 2: D = out
+                if d & 4:
+                    addr, A = A, out
+                    if jump is not None and jump[out]:
+                        PC = addr
+                        if PC in halts: break
+                    continue
+            if jump is not None and jump[out]:
+                PC = A
+                if PC in halts: break
+        self.A, self.D, self.PC = A, D, PC
+        self.steps += steps
+        return steps
+
+def signed(value):
+    return value - 0x10000 if value & 0x8000 else value
+
+# run: python vm.py <file.asm|file.hack|file.bin> [max_steps]
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("用法: python vm.py <file.asm|file.hack|file.bin> [max_steps]")
+        sys.exit(1)
+    max_steps = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    computer = Computer(load_rom(sys.argv[1]))
+    start = time.perf_counter()
+    steps = computer.run(max_steps)
+    elapsed = time.perf_counter() - start
+    print(f"PC={computer.PC:04X} A={computer.A:04X} D={computer.D:04X} steps={steps}")
+    print(' '.join(f"RAM[{i}]={signed(computer.ram[i])}" for i in range(16)))
+    if elapsed > 0:
+        print(f"{steps / elapsed / 1e6:.2f} M instructions/sec")
@@ -1,10 +1,15 @@
-import re
+import os
+import sys
 
-class Compiler:
+# p0parser.py 放在上一層，04-p0ifwhile 和 05-p0func 共用
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from p0parser import ExpressionParser, TokenStream, tokenize
+
+class Compiler(ExpressionParser):
     def __init__(self, code):
-        self.tokens = self.tokenize(code)
-        self.pos = 0
-        self.temp_count = 0
+        self.tokens = TokenStream(self.tokenize(code)) # 邊解析邊切 token
+        self.init_temps()
         self.label_count = 0
         self.ir_code = []  # 儲存生成的四元組
 
@@ -14,44 +19,24 @@ class Compiler:
             ('KEYWORD', r'\b(let|while|if|else|print)\b'), # 關鍵字
             ('NUMBER',  r'\b\d+\b'),            # 整數
             ('ID',      r'\b[a-zA-Z_][a-zA-Z0-9_]*\b'), # 變數名稱
-            ('OP',      r'(<=|==|\+|=)'),       # 運算子
-            ('SKIP',    r'[ \t\n]+'),           # 空白與換行
+            ('OP',      r'(<=|==|\+|\-|\*|/|=)'), # 運算子
+            ('SKIP',    r'[ \t\r\n]+'),         # 空白與換行
             ('MISC',    r'[;(){}]'),            # 其他符號
         ]
-        tok_regex = '|'.join('(?P<%s>%s)' % pair for pair in token_specification)
-        get_token = re.compile(tok_regex).match
-        line = code
-        pos = 0
-        mo = get_token(line)
-        tokens = []
-        while mo is not None:
-            kind = mo.lastgroup
-            value = mo.group(kind)
-            if kind != 'SKIP':
-                tokens.append((kind, value))
-            pos = mo.end()
-            mo = get_token(line, pos)
-        return tokens
+        return tokenize(code, token_specification)
 
     # --- 輔助函式 ---
     def peek(self):
-        if self.pos < len(self.tokens):
-            return self.tokens[self.pos]
-        return None
+        return self.tokens.peek()
 
     def consume(self, expected_value=None):
         token = self.peek()
         if not token:
             raise SyntaxError("Unexpected end of input")
         if expected_value and token[1] != expected_value:
-            raise SyntaxError(f"Expected '{expected_value}', found '{token[1]}'")
-        self.pos += 1
-        return token
-
-    def new_temp(self):
-        t = f"t{self.temp_count}"
-        self.temp_count += 1
-        return t
+            raise SyntaxError(f"Expected '{expected_value}', found '{token[1]}' "
+                              f"at line {token.line}, column {token.column}")
+        return self.tokens.advance()
 
     def new_label(self):
         l = f"L{self.label_count}"
@@ -64,10 +49,11 @@ class Compiler:
     # --- 解析與生成函式 (對應 BNF) ---
 
     def parse_program(self):
-        while self.pos < len(self.tokens):
+        while self.peek() is not None:
             self.parse_statement()
 
     def parse_statement(self):
+        self.release_temps() # 上一個敘述的暫存變數都用完了
         token = self.peek()
         if token[1] == 'let':
             self.parse_declaration()
@@ -156,22 +142,6 @@ class Compiler:
         # 標記整個 if 結束位置
         self.emit('label', end_label, '-', '-')
 
-    def parse_expression(self):
-        # 處理左運算元 (Term)
-        left = self.parse_term()
-        
-        # 檢查是否有運算子 (如 + 或 <=)
-        # 因為 BNF 定義是不分優先順序，所以簡單地由左向右解析
-        while self.peek() and self.peek()[0] == 'OP' and self.peek()[1] != '=':
-            op = self.consume()[1]
-            right = self.parse_term()
-            temp = self.new_temp()
-            # 生成運算四元組: (op, left, right, temp)
-            self.emit(op, left, right, temp)
-            left = temp # 結果變成下一次運算的左運算元
-            
-        return left
-
     def parse_term(self):
         token = self.consume()
         return token[1] # 回傳變數名或數字字串
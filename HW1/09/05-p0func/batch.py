@@ -0,0 +1,158 @@
+import sys
+import time
+
+import numpy as np
+
+from cfg import CFG
+from vm import (DIV, EQ, MOVE, PRINT, GOTO, IF_FALSE, PARAM, CALL, RETURN, TAILCALL,
+                VirtualMachine, load_ir_from_file)
+
+# 算術與比較 (ADD..EQ) 的向量版本，比較結果為 1/0
+VECTOR = [
+    np.add,
+    np.subtract,
+    np.multiply,
+    np.floor_divide,
+    lambda x, y: (x <= y).astype(np.int64),
+    lambda x, y: (x == y).astype(np.int64),
+]
+
+class BatchVM:
+    """
+    同一個程式對 size 組不同的輸入同時執行：每個變數是一個長度 size 的 int64 向量，
+    每個執行個體 (lane) 有自己的指令指標。每一步挑出最小的指令指標，只對停在那裡的
+    lane (mask) 執行該指令，所以 if_false/goto 分岔的 lane 會在迴圈或 if 結束的地方再會合。
+
+    只支援主程式的算術、比較、賦值、print、goto 和 if_false (不支援函數呼叫)；
+    數值是 64 位元整數，不像 VirtualMachine 那樣可以無限大。
+    向量一開始都是 0，沒辦法像 VirtualMachine 那樣在讀到沒設定的變數時報錯，
+    所以主程式入口活著的變數 (可能在設定之前就被讀取) 都必須由 inputs 給定。
+    """
+    def __init__(self, ir_code, size, inputs=None):
+        vm = VirtualMachine(ir_code)
+        if any(op in (PARAM, CALL, TAILCALL) for op, _, _, _ in vm.program):
+            raise ValueError("batch mode does not support function calls")
+        graph = CFG(ir_code)
+        if graph.entries:
+            live_in, _ = graph.liveness()
+            for name in graph.names(live_in[graph.entries[0]]):
+                if name not in (inputs or {}):
+                    raise ValueError(f"Variable '{name}' may be used before assignment (not given as an input)")
+        self.vm = vm
+        self.program = vm.program
+        self.size = size
+        scope = vm.scope_of[0] if vm.program else None
+        template = scope.template if scope else []
+        self.values = np.zeros((max(len(template), 1), size), dtype=np.int64)
+        for slot, value in enumerate(template):
+            if value is not None:
+                self.values[slot] = value
+        for name, value in (inputs or {}).items():
+            if name not in scope.slots:
+                raise ValueError(f"Variable '{name}' is not used by the program")
+            self.values[scope.slots[name]] = value
+        self.ips = np.zeros(size, dtype=np.intp)
+        self.printed = [] # (lane 編號陣列, 值陣列)
+        self.steps = 0    # 執行的向量指令數
+        self.executed = 0 # 所有 lane 合計執行的指令數
+
+    def run(self):
+        program, values, ips = self.program, self.values, self.ips
+        end = len(program)
+        while True:
+            ip = int(ips.min())
+            if ip >= end:
+                break
+            mask = ips == ip
+            full = bool(mask.all())
+            op, a, b, c = program[ip]
+            self.steps += 1
+            self.executed += self.size if full else int(mask.sum())
+
+            if op <= EQ:
+                y = values[b]
+                if op == DIV:
+                    if (mask & (y == 0)).any():
+                        raise ZeroDivisionError("integer division or modulo by zero")
+                    y = np.where(y == 0, 1, y) # 沒在執行的 lane 可能除以 0
+                result = VECTOR[op](values[a], y)
+                if full:
+                    values[c] = result
+                else:
+                    np.copyto(values[c], result, where=mask)
+            elif op == MOVE:
+                np.copyto(values[c], values[a], where=mask)
+            elif op == PRINT:
+                lanes = np.flatnonzero(mask)
+                self.printed.append((lanes, values[a][lanes]))
+            elif op == IF_FALSE:
+                np.copyto(ips, np.where(values[a] == 0, c, ip + 1), where=mask)
+                continue
+            elif op == GOTO:
+                ips[mask] = a
+                continue
+            elif op == RETURN: # 主程式 return：這些 lane 結束
+                ips[mask] = end
+                continue
+            ips[mask] = ip + 1
+        return self.outputs()
+
+    def outputs(self):
+        """每個 lane 依序 print 出來的值"""
+        outputs = [[] for _ in range(self.size)]
+        for lanes, printed in self.printed:
+            for lane, value in zip(lanes.tolist(), printed.tolist()):
+                outputs[lane].append(value)
+        return outputs
+
+    def variable(self, name):
+        """主程式變數在每個 lane 的值 (向量)"""
+        return self.values[self.vm.scope_of[0].slots[name]]
+
+def run_each(ir_code, size, inputs):
+    """逐一建立 VirtualMachine 執行 (與 BatchVM 比較用)，傳回每組輸入的輸出"""
+    columns = {name: np.broadcast_to(value, size).tolist() for name, value in inputs.items()}
+    outputs = []
+    for i in range(size):
+        vm = VirtualMachine(ir_code, quiet=True)
+        scope = vm.scope_of[0]
+        for name, values in columns.items():
+            vm.environment[0][scope.slots[name]] = values[i]
+        outputs.append(vm.run())
+    return outputs
+
+def parse_input(arg):
+    # name=value 或 name=start:stop (range)
+    name, _, value = arg.partition('=')
+    if ':' in value:
+        start, stop = map(int, value.split(':'))
+        return name, np.arange(start, stop, dtype=np.int64)
+    return name, int(value)
+
+# run: python batch.py <中間碼檔案路徑> name=start:stop [name=value ...] [--compare]
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    compare = '--compare' in args
+    if compare:
+        args.remove('--compare')
+    if len(args) < 2:
+        print("用法: python batch.py <中間碼檔案路徑> name=start:stop [name=value ...] [--compare]")
+        print("範例: python batch.py p0/collatz.ir n=1:10001 --compare")
+        sys.exit(1)
+    ir_code = load_ir_from_file(args[0])
+    inputs = dict(parse_input(arg) for arg in args[1:])
+    size = max(len(v) if isinstance(v, np.ndarray) else 1 for v in inputs.values())
+    batch = BatchVM(ir_code, size, inputs)
+    start = time.perf_counter()
+    outputs = batch.run()
+    elapsed = time.perf_counter() - start
+    print(f"BatchVM        {size} lanes, {batch.steps} vector steps, {batch.executed} instructions, time={elapsed:.4f}s")
+    for i in range(min(size, 5)):
+        print(f"  lane {i}: {outputs[i]}")
+    if compare:
+        start = time.perf_counter()
+        expected = run_each(ir_code, size, inputs)
+        each = time.perf_counter() - start
+        print(f"VirtualMachine x{size} time={each:.4f}s speedup={each / elapsed:.2f}x")
+        if expected != outputs:
+            print("警告: 兩種執行方式的輸出不同！")
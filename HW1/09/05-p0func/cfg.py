@@ -0,0 +1,343 @@
+import sys
+
+# 四元組的讀寫欄位，optimizer.py 和 VM 的 free_dead 都用這裡的定義
+BINARY_OPS = ('+', '-', '*', '/', '<=', '==')
+
+def is_const(arg):
+    try:
+        int(arg)
+        return True
+    except ValueError:
+        return False
+
+def is_var(arg):
+    return arg != '-' and not is_const(arg)
+
+def reads(quad):
+    """指令讀取的運算元欄位 (索引 1..3)"""
+    op = quad[0]
+    if op in BINARY_OPS:
+        return (1, 2)
+    if op in ('=', 'print', 'param', 'if_false', 'return'):
+        return (1,) if quad[1] != '-' else ()
+    return ()
+
+def written(quad):
+    """指令寫入的變數，沒有則為 None"""
+    op = quad[0]
+    if op in BINARY_OPS or op == '=' or op == 'call':
+        return quad[3] if quad[3] != '-' else None
+    if op == 'recv':
+        return quad[1]
+    return None
+
+def basic_blocks(ir_code):
+    """
+    切成基本區塊，傳回 [(start, end), ...]：label 和 func_entry 開始新的區塊，
+    goto、if_false、return 結束區塊。call 不會改變目前函數的區域變數，所以不切開。
+    """
+    blocks, start = [], 0
+    for i, quad in enumerate(ir_code):
+        if quad[0] in ('label', 'func_entry') and i > start:
+            blocks.append((start, i))
+            start = i
+        if quad[0] in ('goto', 'if_false', 'return'):
+            blocks.append((start, i + 1))
+            start = i + 1
+    if start < len(ir_code):
+        blocks.append((start, len(ir_code)))
+    return blocks
+
+def bits(mask):
+    """bit vector (int) 裡為 1 的位置"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+class CFG:
+    """
+    四元組的控制流程圖。每個基本區塊是一個節點，goto/if_false 連到目標 label 的區塊，
+    其他指令 (包含 call) 接到下一個區塊，return 沒有後繼。主程式 (索引 0) 和每個
+    func_entry 是各自的入口，函數之間沒有邊，所以同一個圖裡是好幾個互不相連的子圖。
+
+    集合一律用 int 當 bit vector：dominators() 的第 b 個元素的第 d 位元為 1 代表 d 支配 b，
+    liveness() 的位元對應 self.variables 的索引。
+    """
+    def __init__(self, ir_code):
+        self.code = list(ir_code)
+        self.blocks = basic_blocks(self.code)
+        self.block_of = [0] * len(self.code) # 指令索引 -> 區塊索引
+        self.labels = {} # label / 函數名稱 -> 區塊索引
+        for b, (start, end) in enumerate(self.blocks):
+            for i in range(start, end):
+                self.block_of[i] = b
+            op, name = self.code[start][:2]
+            if op in ('label', 'func_entry'):
+                self.labels[name] = b
+        self.entries = [b for b, (start, _) in enumerate(self.blocks)
+                        if start == 0 or self.code[start][0] == 'func_entry']
+        self.succs = [self._successors(b) for b in range(len(self.blocks))]
+        self.preds = [[] for _ in self.blocks]
+        for b, succs in enumerate(self.succs):
+            for s in succs:
+                self.preds[s].append(b)
+        self.variables = sorted({quad[k] for quad in self.code for k in reads(quad) if is_var(quad[k])}
+                                | {written(quad) for quad in self.code if written(quad) is not None})
+        self.index = {name: n for n, name in enumerate(self.variables)}
+        self._dominators = self._liveness = self._assigned = None
+
+    def _successors(self, b):
+        start, end = self.blocks[b]
+        op, arg1, _, result = self.code[end - 1]
+        following = [b + 1] if b + 1 < len(self.blocks) else []
+        if op == 'goto':
+            return [self._label(arg1)]
+        if op == 'if_false':
+            return following + [self._label(result)]
+        if op == 'return':
+            return []
+        return following
+
+    def _label(self, name):
+        if name not in self.labels:
+            raise ValueError(f"Undefined label '{name}'")
+        return self.labels[name]
+
+    def reverse_postorder(self):
+        """從每個入口做 DFS 的 reverse postorder (走不到的區塊不在裡面)"""
+        order, seen = [], set()
+        for entry in self.entries:
+            stack = [(entry, iter(self.succs[entry]))]
+            seen.add(entry)
+            while stack:
+                b, it = stack[-1]
+                for s in it:
+                    if s not in seen:
+                        seen.add(s)
+                        stack.append((s, iter(self.succs[s])))
+                        break
+                else:
+                    order.append(b)
+                    stack.pop()
+        order.reverse()
+        return order
+
+    def dominators(self):
+        """
+        dom(入口) = {入口}，dom(b) = {b} ∪ (所有前驅的 dom 的交集)，反覆計算到不再改變。
+        走不到的區塊只被自己支配。
+        """
+        if self._dominators is None:
+            order = self.reverse_postorder()
+            everything = (1 << len(self.blocks)) - 1
+            dom = [1 << b for b in range(len(self.blocks))]
+            for b in order:
+                if b not in self.entries:
+                    dom[b] = everything
+            reachable = set(order)
+            changed = True
+            while changed:
+                changed = False
+                for b in order:
+                    if b in self.entries:
+                        continue
+                    new = everything
+                    for p in self.preds[b]:
+                        if p in reachable:
+                            new &= dom[p]
+                    new |= 1 << b
+                    if new != dom[b]:
+                        dom[b] = new
+                        changed = True
+            self._dominators = dom
+        return self._dominators
+
+    def dominates(self, a, b):
+        return bool(self.dominators()[b] >> a & 1)
+
+    def back_edges(self):
+        """b -> h 而且 h 支配 b 的邊 (迴圈跳回開頭的 goto)"""
+        return [(b, h) for b in range(len(self.blocks)) for h in self.succs[b] if self.dominates(h, b)]
+
+    def natural_loops(self):
+        """
+        每個迴圈開頭 h -> 迴圈內的區塊集合：從跳回 h 的區塊沿著前驅往回走，走到 h 為止。
+        同一個 h 有好幾條跳回來的邊時合成一個迴圈。
+        """
+        loops = {}
+        for tail, header in self.back_edges():
+            body = loops.setdefault(header, {header})
+            stack = [tail]
+            while stack:
+                b = stack.pop()
+                if b not in body:
+                    body.add(b)
+                    stack.extend(self.preds[b])
+        return loops
+
+    def use_def(self, b):
+        """區塊 b 的 (use, def)：use 是在區塊內被寫入之前就讀取的變數"""
+        use = define = 0
+        index = self.index
+        start, end = self.blocks[b]
+        for quad in self.code[start:end]:
+            for k in reads(quad):
+                if quad[k] in index:
+                    bit = 1 << index[quad[k]]
+                    if not define & bit:
+                        use |= bit
+            target = written(quad)
+            if target is not None:
+                define |= 1 << index[target]
+        return use, define
+
+    def liveness(self):
+        """
+        活躍變數分析 (backward)：
+        out(b) = ∪ in(s)，in(b) = use(b) ∪ (out(b) - def(b))，反覆計算到不再改變。
+        傳回 (live_in, live_out) 兩個 bit vector list。
+        """
+        if self._liveness is None:
+            n = len(self.blocks)
+            use_def = [self.use_def(b) for b in range(n)]
+            live_in, live_out = [0] * n, [0] * n
+            changed = True
+            while changed:
+                changed = False
+                for b in reversed(range(n)):
+                    out = 0
+                    for s in self.succs[b]:
+                        out |= live_in[s]
+                    use, define = use_def[b]
+                    new = use | (out & ~define)
+                    if new != live_in[b] or out != live_out[b]:
+                        live_in[b], live_out[b] = new, out
+                        changed = True
+            self._liveness = (live_in, live_out)
+        return self._liveness
+
+    def assigned(self):
+        """
+        一定設定過的變數 (forward)：入口什麼都沒有，in(b) = 所有前驅的 out 的交集，
+        out(b) = in(b) ∪ def(b)，反覆計算到不再改變。參數由函數開頭的 recv 設定。
+        傳回 (assigned_in, assigned_out) 兩個 bit vector list。
+        """
+        if self._assigned is None:
+            order = self.reverse_postorder()
+            reachable = set(order)
+            everything = (1 << len(self.variables)) - 1
+            define = [self.use_def(b)[1] for b in range(len(self.blocks))]
+            assigned_in = [0 if b in self.entries else everything for b in range(len(self.blocks))]
+            assigned_out = [assigned_in[b] | define[b] for b in range(len(self.blocks))]
+            changed = True
+            while changed:
+                changed = False
+                for b in order:
+                    if b in self.entries:
+                        continue
+                    new = everything
+                    for p in self.preds[b]:
+                        if p in reachable:
+                            new &= assigned_out[p]
+                    if new != assigned_in[b]:
+                        assigned_in[b], assigned_out[b] = new, new | define[b]
+                        changed = True
+            self._assigned = (assigned_in, assigned_out)
+        return self._assigned
+
+    def live_after(self):
+        """每個指令執行完之後還活著的變數 (bit vector list，索引與 ir_code 相同)"""
+        _, live_out = self.liveness()
+        index = self.index
+        after = [0] * len(self.code)
+        for b, (start, end) in enumerate(self.blocks):
+            live = live_out[b]
+            for i in range(end - 1, start - 1, -1):
+                after[i] = live
+                quad = self.code[i]
+                target = written(quad)
+                if target is not None:
+                    live &= ~(1 << index[target])
+                for k in reads(quad):
+                    if quad[k] in index:
+                        live |= 1 << index[quad[k]]
+        return after
+
+    def names(self, mask):
+        return [self.variables[n] for n in bits(mask)]
+
+def check(ir_code):
+    """
+    用範例程式檢查分析結果，傳回 (問題 list, 說明)：
+    * 每個區塊都被自己和所屬函數的入口支配，入口只被自己支配
+    * 函數入口活著的變數只能是參數 (否則是讀了沒設定過的變數)；主程式入口活著的變數是外部輸入
+    * 以 VirtualMachine(free_dead=True) 執行 (call 時清掉呼叫者已經死掉的槽位)，輸出要和一般執行相同
+    """
+    from vm import VirtualMachine
+    graph = CFG(ir_code)
+    problems = []
+    dom = graph.dominators()
+    entry_of = {}
+    for entry in graph.entries:
+        stack = [entry]
+        while stack:
+            b = stack.pop()
+            if b not in entry_of:
+                entry_of[b] = entry
+                stack.extend(graph.succs[b])
+    for b in range(len(graph.blocks)):
+        if not dom[b] >> b & 1:
+            problems.append(f"block {b} does not dominate itself")
+        if b in graph.entries and dom[b] != 1 << b:
+            problems.append(f"entry block {b} is dominated by {list(bits(dom[b]))}")
+        if b in entry_of and not graph.dominates(entry_of[b], b):
+            problems.append(f"block {b} is not dominated by its entry {entry_of[b]}")
+    live_in, _ = graph.liveness()
+    inputs = graph.names(live_in[graph.entries[0]])
+    for entry in graph.entries[1:]:
+        start, _ = graph.blocks[entry]
+        params = {quad[1] for quad in graph.code[start:] if quad[0] == 'recv'}
+        for name in graph.names(live_in[entry]):
+            if name not in params:
+                problems.append(f"{graph.code[start][1]}: '{name}' may be used before assignment")
+    notes = f"{len(graph.blocks)} blocks {sum(map(len, graph.succs))} edges {len(graph.variables)} vars"
+    if inputs:
+        # 需要外部輸入的程式 (例如 batch.py 的 collatz) 不能直接執行
+        return problems, notes + f", inputs {inputs}, not run"
+    expected = VirtualMachine(ir_code, quiet=True).run()
+    vm = VirtualMachine(ir_code, quiet=True, free_dead=True)
+    if vm.run() != expected:
+        problems.append("free_dead changes the output")
+    freed = sum(len(slots) for slots in vm.dead_at_call.values())
+    return problems, notes + f", {freed} dead slots cleared at {len(vm.dead_at_call)} calls"
+
+# run: python cfg.py <原始碼.p0|中間碼.ir> ...   (印出區塊、支配者與活躍變數，並檢查分析結果)
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("用法: python cfg.py [-v] <原始碼.p0|中間碼.ir> ...")
+        sys.exit(1)
+    from compiler import Compiler
+    from vm import load_ir_from_file
+    verbose = '-v' in sys.argv
+    failed = 0
+    for filename in [arg for arg in sys.argv[1:] if arg != '-v']:
+        if filename.endswith('.p0'):
+            with open(filename, 'r', encoding='utf-8') as f:
+                compiler = Compiler(f.read())
+            compiler.parse_program()
+            ir_code = compiler.ir_code
+        else:
+            ir_code = load_ir_from_file(filename)
+        if verbose:
+            graph = CFG(ir_code)
+            live_in, live_out = graph.liveness()
+            for b, (start, end) in enumerate(graph.blocks):
+                print(f"B{b} [{start}:{end}] succs={graph.succs[b]} dom={list(bits(graph.dominators()[b]))}")
+                print(f"    in={graph.names(live_in[b])} out={graph.names(live_out[b])}")
+        problems, notes = check(ir_code)
+        failed += bool(problems)
+        print(f"{'ok' if not problems else 'FAIL':<5} {notes}  {filename}")
+        for problem in problems:
+            print(f"      {problem}")
+    sys.exit(1 if failed else 0)
@@ -1,11 +1,17 @@
-import re
+import os
 import sys
 
-class Compiler:
+# p0parser.py 放在上一層，04-p0ifwhile 和 05-p0func 共用
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import irfile
+import optimizer
+from p0parser import ExpressionParser, TokenStream, tokenize
+
+class Compiler(ExpressionParser):
     def __init__(self, code):
-        self.tokens = self.tokenize(code)
-        self.pos = 0
-        self.temp_count = 0
+        self.tokens = TokenStream(self.tokenize(code)) # 邊解析邊切 token
+        self.init_temps()
         self.label_count = 0
         self.ir_code = []
 
@@ -16,43 +22,23 @@ class Compiler:
             ('NUMBER',  r'\b\d+\b'),
             ('ID',      r'\b[a-zA-Z_][a-zA-Z0-9_]*\b'),
             ('OP',      r'(<=|==|\+|\-|\*|/|=)'),
-            ('SKIP',    r'[ \t\n]+'),
+            ('SKIP',    r'[ \t\r\n]+'),
             ('MISC',    r'[;(){},]'), # 新增逗號
         ]
-        tok_regex = '|'.join('(?P<%s>%s)' % pair for pair in token_specification)
-        get_token = re.compile(tok_regex).match
-        line = code
-        pos = 0
-        mo = get_token(line)
-        tokens = []
-        while mo is not None:
-            kind = mo.lastgroup
-            value = mo.group(kind)
-            if kind != 'SKIP':
-                tokens.append((kind, value))
-            pos = mo.end()
-            mo = get_token(line, pos)
-        return tokens
+        return tokenize(code, token_specification)
 
     # --- 輔助工具 ---
     def peek(self):
-        if self.pos < len(self.tokens):
-            return self.tokens[self.pos]
-        return None
+        return self.tokens.peek()
 
     def consume(self, expected_value=None):
         token = self.peek()
         if not token:
             raise SyntaxError("Unexpected end of input")
         if expected_value and token[1] != expected_value:
-            raise SyntaxError(f"Expected '{expected_value}', found '{token[1]}'")
-        self.pos += 1
-        return token
-
-    def new_temp(self):
-        t = f"t{self.temp_count}"
-        self.temp_count += 1
-        return t
+            raise SyntaxError(f"Expected '{expected_value}', found '{token[1]}' "
+                              f"at line {token.line}, column {token.column}")
+        return self.tokens.advance()
 
     def new_label(self):
         l = f"L{self.label_count}"
@@ -70,7 +56,7 @@ class Compiler:
         start_label = self.new_label()
         self.emit('goto', start_label, '-', '-') # 跳到主程式開始
         
-        while self.pos < len(self.tokens):
+        while self.peek() is not None:
             token = self.peek()
             if token[1] == 'fn':
                 self.parse_function_def()
@@ -108,6 +94,7 @@ class Compiler:
         self.emit('return', '-', '-', '-')
 
     def parse_statement(self):
+        self.release_temps() # 上一個敘述的暫存變數都用完了
         token = self.peek()
         if token[1] == 'let':
             self.parse_declaration()
@@ -181,17 +168,6 @@ class Compiler:
             self.parse_block() # false block
         self.emit('label', end_l, '-', '-')
 
-    def parse_expression(self):
-        # 簡單的左結合解析
-        left = self.parse_term()
-        while self.peek() and self.peek()[0] == 'OP' and self.peek()[1] != '=':
-            op = self.consume()[1]
-            right = self.parse_term()
-            temp = self.new_temp()
-            self.emit(op, left, right, temp)
-            left = temp
-        return left
-
     def parse_term(self):
         token = self.peek()
         if token[0] == 'NUMBER':
@@ -223,6 +199,9 @@ class Compiler:
         for arg in args:
             self.emit('param', arg, '-', '-')
             
+        # 引數已經放進 param，暫存變數可以給回傳值用
+        self.release(*args)
+
         # 生成 Call 指令
         result_temp = self.new_temp()
         # arg1: 函數名, arg2: 參數數量, result: 接收回傳值的暫存器
@@ -232,13 +211,22 @@ class Compiler:
 # --- 主程式執行區塊 ---
 
 if __name__ == "__main__":
+    # -O0 / -O1 / -O2 / -O3 (-O 等於 -O3)：最佳化等級，見 optimizer.py
+    args = sys.argv[1:]
+    level = 0
+    for arg in args[:]:
+        if arg.startswith('-O'):
+            level = int(arg[2:] or max(optimizer.PASSES))
+            args.remove(arg)
+
     # 檢查是否提供了檔案路徑參數
-    if len(sys.argv) < 2:
-        print("使用方式: python compiler.py <原始碼檔案路徑>")
+    if len(args) < 1 or level not in optimizer.PASSES:
+        print("使用方式: python compiler.py [-O0|-O1|-O2|-O3] <原始碼檔案路徑> [二進位中間碼輸出檔]")
         print("範例: python compiler.py source.code > ir.txt")
+        print("      python compiler.py -O source.code ir.irb")
         sys.exit(1)
     
-    source_filename = sys.argv[1]
+    source_filename = args[0]
     
     try:
         # 讀取程式碼檔案
@@ -248,13 +236,17 @@ if __name__ == "__main__":
         # 編譯程式碼
         compiler = Compiler(source_code)
         compiler.parse_program()
+        ir_code = optimizer.optimize(compiler.ir_code, level)
+
+        # 有指定輸出檔就寫成二進位中間碼 (見 irfile.py)，vm.py 可以直接 mmap 載入
+        if len(args) > 1:
+            irfile.write_ir(ir_code, args[1])
+            sys.exit(0)
 
         # 輸出 IR (這裡輸出純格式，方便重定向到檔案)
-        for q in compiler.ir_code:
-            op, a1, a2, res = q
-            # 使用 tab 隔開，或者固定寬度空格，讓您的 load_ir_from_file 容易讀取
-            # 這裡使用您之前要求的固定寬度對齊格式
-            print(f"{op:<12} {a1:<10} {a2:<10} {res:<10}")
+        for q in ir_code:
+            # 使用固定寬度對齊格式，讓 load_ir_from_file 容易讀取
+            print(irfile.format_quad(q))
             
     except FileNotFoundError:
         print(f"錯誤: 找不到檔案 '{source_filename}'")
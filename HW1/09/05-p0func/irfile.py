@@ -0,0 +1,88 @@
+import mmap
+import struct
+import sys
+from array import array
+
+# 二進位中間碼檔 (.irb)：
+#   檔頭       magic 'P0IR'、版本、字串數 n、四元組數 m、字串表長度 (各 4 bytes，little-endian)
+#   字串表     n 個以 '\n' 分隔的 UTF-8 字串 (補齊到 4 的倍數)
+#   四元組     m 筆固定長度的紀錄，每筆 4 個 uint32 (op, arg1, arg2, result 的字串編號)
+# 每個不同的字串只存一次，載入時不必逐行切割。
+MAGIC = b'P0IR'
+VERSION = 1
+HEADER = struct.Struct('<4sIIII')
+
+def format_quad(quad):
+    """文字格式的一行 (固定寬度對齊，load_ir_from_file 用 split() 讀回)"""
+    op, a1, a2, res = quad
+    return f"{op:<12} {a1:<10} {a2:<10} {res:<10}"
+
+def dumps(ir_code):
+    strings = {}
+    indices = array('I')
+    for quad in ir_code:
+        for field in quad:
+            index = strings.get(field)
+            if index is None:
+                index = strings[field] = len(strings)
+            indices.append(index)
+    if any('\n' in s for s in strings):
+        raise ValueError("IR fields cannot contain newlines")
+    blob = '\n'.join(strings).encode('utf-8')
+    size = len(blob)
+    blob += b'\0' * (-size % 4)
+    if sys.byteorder != 'little':
+        indices.byteswap()
+    return HEADER.pack(MAGIC, VERSION, len(strings), len(ir_code), size) + blob + indices.tobytes()
+
+def write_ir(ir_code, filename):
+    with open(filename, 'wb') as f:
+        f.write(dumps(ir_code))
+
+def is_binary(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def load_ir(filename):
+    """以 mmap 讀入 .irb，傳回四元組 (tuple) 的 list，與文字格式讀到的相同"""
+    with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        with memoryview(m) as view:
+            ir_code = _decode(view, filename)
+    return ir_code
+
+def _decode(view, filename):
+    # 這裡建立的 memoryview 都是區域變數，函數結束時就釋放，mmap 才能關閉。
+    # 長度不夠要在切出任何 memoryview 之前就報錯，否則例外還留著它們，mmap 關不掉
+    if len(view) < HEADER.size:
+        raise ValueError(f"{filename}: not a P0IR version {VERSION} file")
+    magic, version, nstrings, nquads, size = HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{filename}: not a P0IR version {VERSION} file")
+    start = HEADER.size
+    end = start + size + (-size % 4) + 16 * nquads
+    if len(view) < end:
+        raise ValueError(f"{filename}: truncated ({len(view)} of {end} bytes)")
+    strings = str(view[start:start + size], 'utf-8').split('\n') if nstrings else []
+    if len(strings) != nstrings:
+        raise ValueError(f"{filename}: bad string table ({len(strings)} of {nstrings} strings)")
+    start += size + (-size % 4)
+    words = view[start:start + 16 * nquads].cast('I')
+    if sys.byteorder != 'little':
+        words = array('I', words.tobytes())
+        words.byteswap()
+    fields = map(strings.__getitem__, words)
+    return list(zip(fields, fields, fields, fields))
+
+# run: python irfile.py <輸入.ir|輸入.irb> [輸出.irb]   (文字與二進位格式互轉，沒有輸出檔就印出文字格式)
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("用法: python irfile.py <輸入.ir|輸入.irb> [輸出.irb]")
+        sys.exit(1)
+    from vm import load_ir_from_file
+    ir_code = load_ir_from_file(sys.argv[1])
+    if len(sys.argv) > 2:
+        write_ir(ir_code, sys.argv[2])
+        print(f"{len(ir_code)} 條指令 -> {sys.argv[2]}")
+    else:
+        for quad in ir_code:
+            print(format_quad(quad))
@@ -0,0 +1,211 @@
+import sys
+import time
+
+from vm import (ADD, SUB, MUL, DIV, LE, EQ, MOVE, PRINT, GOTO, IF_FALSE, PARAM, CALL, RETURN, TAILCALL,
+                MAX_DEPTH, VirtualMachine, load_ir_from_file)
+
+MAX_BLOCK = 256 # 一個區塊最多編譯幾個指令
+
+# 算術與比較對應的 Python 運算式，x、y 會換成 env[槽位] 或常數
+BINARY_EXPR = {
+    ADD: '{x} + {y}',
+    SUB: '{x} - {y}',
+    MUL: '{x} * {y}',
+    DIV: '{x} // {y}',
+    LE:  '1 if {x} <= {y} else 0',
+    EQ:  '1 if {x} == {y} else 0',
+}
+
+def compile_block(program, entry, scope):
+    """
+    把從 entry 開始的一段四元組翻譯成 Python 函數 block(env, args, out)，
+    傳回 (下一個指令的索引, 執行的指令數)。函數本身與區塊的指令數一起傳回。
+
+    if_false 在區塊中間變成提早 return (side exit)，區塊在 goto、程式結尾或
+    MAX_BLOCK 個指令處結束；call 和 return 要切換 frame，留給 JitVirtualMachine.run()
+    處理，所以區塊停在它們前面。常數槽位直接以數字寫進程式碼。
+
+    賦值、print、param、if_false 和 == 讀到還沒設定的變數 (None) 時丟出 TypeError，
+    其他算術運算本來就會出錯；同一個區塊裡已經檢查過或寫入過的槽位不再檢查。
+    """
+    template = scope.template
+    def value(slot):
+        return repr(template[slot]) if template[slot] is not None else f'env[{slot}]'
+    defined = set()
+    def check(slot):
+        if template[slot] is None and slot not in defined:
+            lines.append(f'    if env[{slot}] is None: raise TypeError')
+            defined.add(slot)
+    lines = ['def block(env, args, out):']
+    ip, size = entry, len(program)
+    while ip < size and ip - entry < MAX_BLOCK:
+        op, a, b, c = program[ip]
+        if op in (CALL, TAILCALL, RETURN):
+            break
+        ip += 1
+        if op in (MOVE, IF_FALSE, PARAM, PRINT, EQ):
+            check(a)
+        if op == EQ:
+            check(b)
+        if op in BINARY_EXPR:
+            lines.append(f'    env[{c}] = ' + BINARY_EXPR[op].format(x=value(a), y=value(b)))
+            defined.add(c)
+        elif op == MOVE:
+            lines.append(f'    env[{c}] = {value(a)}')
+            defined.add(c)
+        elif op == IF_FALSE:
+            lines.append(f'    if {value(a)} == 0: return {c}, {ip - entry}')
+        elif op == GOTO:
+            lines.append(f'    return {a}, {ip - entry}')
+            break
+        elif op == PARAM:
+            lines.append(f'    args.append({value(a)})')
+        elif op == PRINT:
+            lines.append(f'    out({value(a)})')
+    else:
+        lines.append(f'    return {ip}, {ip - entry}')
+    if op in (CALL, TAILCALL, RETURN):
+        lines.append(f'    return {ip}, {ip - entry}')
+    source = '\n'.join(lines) + '\n'
+    env = {}
+    exec(compile(source, f'<p0 block {entry}>', 'exec'), env)
+    return env['block'], ip - entry, source
+
+class JitVirtualMachine(VirtualMachine):
+    """以區塊為單位把四元組編譯成 Python 函數執行的 VirtualMachine"""
+
+    def __init__(self, ir_code, max_depth=MAX_DEPTH, output=None, quiet=False, free_dead=False):
+        super().__init__(ir_code, max_depth, output, quiet, free_dead)
+        self.blocks = [None] * len(self.program) # entry -> (區塊函數, 指令數)，程式不會變，所以不需要失效
+
+    def block(self, entry):
+        fn, count, _ = compile_block(self.program, entry, self.scope_of[entry])
+        block = self.blocks[entry] = (fn, count)
+        return block
+
+    def run(self, max_steps=None):
+        if self.done:
+            return self.output.values
+        self._begin()
+
+        program, blocks = self.program, self.blocks
+        size = len(program)
+        max_depth = self.max_depth
+        environment, ret_stack, args_buffer = self.environment, self.ret_stack, self.args_buffer
+        dead_at_call = self.dead_at_call
+        output = self.output
+        emit = output.emit
+        env = environment[-1]
+        ip = self.ip
+        budget = float('inf') if max_steps is None else max_steps
+        steps = 0
+        fallback = False
+        try:
+            while ip < size and steps < budget:
+                op, a, b, c = program[ip]
+                if op == CALL:
+                    # 與 VirtualMachine.run() 相同的呼叫慣例
+                    if len(ret_stack) >= max_depth:
+                        raise RecursionError(f"call depth exceeded {max_depth} (calling {b.name})")
+                    if dead_at_call:
+                        for slot in dead_at_call.get(ip, ()):
+                            env[slot] = None
+                    ret_stack.append((ip + 1, c, b.pool))
+                    if b.pool:
+                        env = b.pool.pop()
+                        env[:] = b.template
+                    else:
+                        env = b.template[:]
+                    n = b.nparams
+                    if n:
+                        if len(args_buffer) < n:
+                            raise IndexError(f"call needs {n} arguments, only {len(args_buffer)} passed")
+                        env[:n] = args_buffer[-n:]
+                        del args_buffer[-n:]
+                    environment.append(env)
+                    ip = a
+                    steps += 1
+                elif op == TAILCALL:
+                    n = b.nparams
+                    if len(args_buffer) < n:
+                        raise IndexError(f"call needs {n} arguments, only {len(args_buffer)} passed")
+                    if b is not c:
+                        c.pool.append(env)
+                        env = b.pool.pop() if b.pool else b.template[:]
+                        environment[-1] = env
+                    env[:] = b.template
+                    if n:
+                        env[:n] = args_buffer[-n:]
+                        del args_buffer[-n:]
+                    ip = a
+                    steps += 1
+                elif op == RETURN:
+                    ret_val = env[a] if a is not None else None
+                    if ret_val is None and a is not None:
+                        raise TypeError
+                    steps += 1
+                    if not ret_stack:
+                        environment.pop()
+                        ip = size
+                        break
+                    ip, target, pool = ret_stack.pop()
+                    pool.append(environment.pop())
+                    env = environment[-1]
+                    if target is not None and ret_val is not None:
+                        env[target] = ret_val
+                else:
+                    block = blocks[ip] or self.block(ip)
+                    if budget - steps < block[1]:
+                        fallback = True
+                        break
+                    ip, n = block[0](env, args_buffer, emit)
+                    steps += n
+        except TypeError:
+            # 區塊中某個指令讀到還沒設定的變數，從區塊開頭找出是哪一個
+            self.ip = ip
+            for index in range(ip, min(ip + MAX_BLOCK, size)):
+                self.ip = index
+                self._undefined(env, program[index])
+                if program[index][0] in (CALL, TAILCALL, RETURN):
+                    break
+            self.ip = ip
+            raise
+        except Exception:
+            self.ip = ip
+            raise
+        finally:
+            self.steps += steps
+            output.flush()
+        self.ip = ip
+
+        if fallback:
+            # 剩下的指令不夠跑完整個區塊，改用逐指令執行補足
+            return VirtualMachine.run(self, budget - steps)
+        self._finish()
+        return output.values
+
+def benchmark(ir_code, repeat=3):
+    """在同一個程式上比較逐指令解譯 (VirtualMachine) 與區塊編譯 (JitVirtualMachine) 的速度"""
+    results = {}
+    for cls in (VirtualMachine, JitVirtualMachine):
+        best = None
+        for _ in range(repeat):
+            vm = cls(ir_code, quiet=True)
+            start = time.perf_counter()
+            outputs = vm.run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[cls.__name__] = (best, outputs)
+    return results
+
+# run: python jit.py <中間碼檔案路徑>   (比較兩種執行方式的速度)
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("用法: python jit.py <中間碼檔案路徑>")
+        sys.exit(1)
+    results = benchmark(load_ir_from_file(sys.argv[1]))
+    base = results['VirtualMachine'][0]
+    for name, (elapsed, _) in results.items():
+        print(f"{name:<18} time={elapsed:.4f}s speedup={base / elapsed:.2f}x")
+    if results['VirtualMachine'][1] != results['JitVirtualMachine'][1]:
+        print("警告: 兩種執行方式的輸出不同！")
@@ -0,0 +1,499 @@
+import operator
+import re
+import sys
+
+from cfg import BINARY_OPS, CFG, basic_blocks, is_const, is_var, reads, written
+
+# compiler.py 產生的暫存變數名稱 ($ 開頭，使用者的變數不會是這種名稱)。暫存變數會重複使用 (見 p0parser.py)，
+# 但不會跨越基本區塊：離開區塊時所有暫存變數都是死的
+TEMP = re.compile(r'\$t\d+$')
+
+COMMUTATIVE = ('+', '*', '==')
+FOLD = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.floordiv,
+    '<=': lambda x, y: 1 if x <= y else 0,
+    '==': lambda x, y: 1 if x == y else 0,
+}
+
+def replace(quad, index, value):
+    quad = list(quad)
+    quad[index] = value
+    return tuple(quad)
+
+def _kill(values, var):
+    # var 被重新指定：它本身和所有以它為值的對應都失效
+    values.pop(var, None)
+    for key in [key for key, value in values.items() if value == var]:
+        del values[key]
+
+def _removable(quad):
+    # 結果沒人用就能刪掉的運算與複製；除數不是非 0 常數的 / 可能在執行時除以 0，要保留
+    op, _, a2, _ = quad
+    if op == '/':
+        return is_const(a2) and int(a2) != 0
+    return op in BINARY_OPS or op == '='
+
+def fold_constants(ir_code):
+    """
+    常數傳播與常數折疊 (區塊內)：已知是常數的變數直接換成常數，兩個運算元都是常數的運算
+    在編譯時算好，if_false 的條件是常數時改成 goto 或刪掉。除以 0 留到執行時報錯。
+    """
+    code = list(ir_code)
+    for start, end in basic_blocks(code):
+        consts = {}
+        for i in range(start, end):
+            quad = code[i]
+            for index in reads(quad):
+                if quad[index] in consts:
+                    quad = replace(quad, index, consts[quad[index]])
+            op, a1, a2, res = quad
+            if op in FOLD and is_const(a1) and is_const(a2) and not (op == '/' and int(a2) == 0):
+                quad = ('=', str(FOLD[op](int(a1), int(a2))), '-', res)
+            elif op == 'if_false' and is_const(a1):
+                quad = ('goto', res, '-', '-') if int(a1) == 0 else ('label', f'_{i}', '-', '-')
+            code[i] = quad
+            target = written(quad)
+            if target is not None:
+                _kill(consts, target)
+                if quad[0] == '=' and is_const(quad[1]):
+                    consts[target] = quad[1]
+    # 條件永遠成立的 if_false 先換成不做事的標記，最後再刪掉
+    return [quad for quad in code if not (quad[0] == 'label' and quad[1].startswith('_'))]
+
+def propagate_copies(ir_code):
+    """
+    複製傳播 (區塊內)：
+    * t = a op b 接著 x = t，而這個 t 的值只用這一次：直接寫成 x = a op b，
+      省掉 parse_declaration 多出來的那個 =
+    * x = y 之後，讀 x 的地方改讀 y (直到 x 或 y 被重新指定)
+    """
+    code = list(ir_code)
+    blocks = basic_blocks(code)
+    for start, end in blocks:
+        for i in range(start, end):
+            quad = code[i]
+            if quad[0] != '=' or not TEMP.match(quad[1]) or _read_later(code, i, end, quad[1]):
+                continue
+            temp, target = quad[1], quad[3]
+            # 往回找定義 temp 的指令，中間不能讀寫 target
+            for j in range(i - 1, start - 1, -1):
+                other = code[j]
+                if other is None:
+                    continue
+                if written(other) == temp:
+                    if other[0] in BINARY_OPS or other[0] in ('=', 'call'):
+                        code[j] = replace(other, 3, target)
+                        code[i] = None
+                    break
+                if written(other) == target or target in (other[k] for k in reads(other)) \
+                        or temp in (other[k] for k in reads(other)):
+                    break
+    for start, end in blocks:
+        copies = {}
+        for i in range(start, end):
+            quad = code[i]
+            if quad is None:
+                continue
+            for index in reads(quad):
+                if quad[index] in copies:
+                    quad = replace(quad, index, copies[quad[index]])
+            code[i] = quad
+            target = written(quad)
+            if target is not None:
+                _kill(copies, target)
+                if quad[0] == '=' and is_var(quad[1]) and quad[1] != target:
+                    copies[target] = quad[1]
+    return [quad for quad in code if quad is not None]
+
+def eliminate_common_subexpressions(ir_code):
+    """共同子運算式 (區塊內)：同一個運算在運算元沒變之前再算一次，改成複製先前的結果"""
+    code = list(ir_code)
+    for start, end in basic_blocks(code):
+        available = {} # (op, a, b) -> 存放結果的變數
+        for i in range(start, end):
+            quad = code[i]
+            op, a1, a2, res = quad
+            key = None
+            if op in BINARY_OPS:
+                key = (op,) + (tuple(sorted((a1, a2))) if op in COMMUTATIVE else (a1, a2))
+                if key in available:
+                    code[i] = quad = ('=', available[key], '-', res)
+            target = written(quad)
+            if target is not None:
+                for other in [k for k, v in available.items() if v == target or target in k[1:]]:
+                    del available[other]
+                if key is not None and quad[0] in BINARY_OPS and target not in key[1:]:
+                    available[key] = target
+    return code
+
+def _read_later(code, i, end, temp):
+    # code[i] 之後、temp 被重新指定之前，區塊裡還有沒有指令讀取 temp
+    for quad in code[i + 1:end]:
+        if quad is None:
+            continue
+        if temp in (quad[k] for k in reads(quad)):
+            return True
+        if written(quad) == temp:
+            return False
+    return False
+
+def remove_dead_temps(ir_code):
+    """
+    刪掉結果是暫存變數、而且在被重新指定之前沒有指令讀取的運算與複製
+    (call 有副作用，可能除以 0 的 / 也會報錯，都保留)。
+    每個區塊從後往前掃一次，刪掉的指令讀的暫存變數也就不算被用到了。
+    """
+    code = list(ir_code)
+    kept = []
+    for start, end in reversed(basic_blocks(code)):
+        live = set()
+        for quad in reversed(code[start:end]):
+            target = written(quad)
+            if _removable(quad) and TEMP.match(quad[3]) and target not in live:
+                continue
+            live.discard(target)
+            live.update(quad[k] for k in reads(quad))
+            kept.append(quad)
+    kept.reverse()
+    return kept
+
+def split_temps(ir_code):
+    """
+    把暫存變數的每一次指定都換成不同的名稱。compiler.py 會重複使用 $t0、$t1，
+    但 $t0 被覆寫之後，CSE 就不能再拿它之前的值來用了，所以最佳化之前先拆開。
+    """
+    code = list(ir_code)
+    count = 0
+    for start, end in basic_blocks(code):
+        names = {}
+        for i in range(start, end):
+            quad = code[i]
+            for index in reads(quad):
+                if quad[index] in names:
+                    quad = replace(quad, index, names[quad[index]])
+            target = written(quad)
+            if target is not None and TEMP.match(target):
+                names[target] = f"$t{count}"
+                count += 1
+                quad = replace(quad, 3, names[target])
+            code[i] = quad
+    return code
+
+def pack_temps(ir_code):
+    """split_temps 的反向：值已經用完的暫存變數名稱給下一個暫存變數用，每次都挑編號最小的"""
+    code = list(ir_code)
+    for start, end in basic_blocks(code):
+        last = {} # 暫存變數 -> 最後一次被讀取的位置
+        for i in range(start, end):
+            for index in reads(code[i]):
+                last[code[i][index]] = i
+        names, free, count = {}, [], 0
+        for i in range(start, end):
+            quad = code[i]
+            for index in reads(quad):
+                name = quad[index]
+                if name in names:
+                    quad = replace(quad, index, names[name])
+                    if last[name] == i and names[name] not in free:
+                        free.append(names[name])
+            target = written(quad)
+            if target is not None and TEMP.match(target):
+                if free:
+                    free.sort(key=lambda t: int(t[2:]))
+                    names[target] = free.pop(0)
+                else:
+                    names[target] = f"$t{count}"
+                    count += 1
+                quad = replace(quad, 3, names[target])
+                if last.get(target, -1) <= i: # 沒有人讀的結果 (例如沒用到的回傳值)
+                    free.append(names[target])
+            code[i] = quad
+    return code
+
+def remove_dead_stores(ir_code):
+    """
+    用 cfg.py 的活躍變數分析 (跨區塊) 刪掉結果之後不會再被讀取的運算與複製，
+    例如 let s = 60 * 60 * 24; 的 s 被常數傳播取代之後，這個指定就沒用了。
+    可能除以 0 的 / 即使結果沒用也要保留，-O2 才會和 -O0 一樣報錯。
+    """
+    graph = CFG(ir_code)
+    live_after = graph.live_after()
+    return [quad for i, quad in enumerate(ir_code)
+            if not (_removable(quad) and not live_after[i] >> graph.index[quad[3]] & 1)]
+
+def _loop(code, header_label):
+    """
+    找出以 header_label 為開頭的自然迴圈，傳回 (CFG, 迴圈的區塊集合, 開頭區塊, 迴圈內的指令索引,
+    迴圈開始或離開時還會用到舊值的變數 bit vector)。
+    只處理 parse_while 產生的形狀：迴圈外只能從 label 前一個指令直接往下走進來，
+    所以 label 前面就是前置區塊 (preheader)，提出來的指令插在那裡。不符合時傳回 None。
+    """
+    graph = CFG(code)
+    header = graph.labels.get(header_label)
+    body = graph.natural_loops().get(header)
+    if body is None:
+        return None
+    start = graph.blocks[header][0]
+    if start == 0 or code[start - 1][0] in ('goto', 'if_false', 'return'):
+        return None
+    if [p for p in graph.preds[header] if p not in body] != [header - 1]:
+        return None
+    live_in, _ = graph.liveness()
+    blocked = live_in[header]
+    for b in body:
+        for s in graph.succs[b]:
+            if s not in body:
+                blocked |= live_in[s]
+    indices = sorted(i for b in body for i in range(*graph.blocks[b]))
+    return graph, body, header, indices, blocked
+
+def _defs(code, indices):
+    defs = {}
+    for i in indices:
+        target = written(code[i])
+        if target is not None:
+            defs[target] = defs.get(target, 0) + 1
+    return defs
+
+def hoist_invariants(ir_code, header_label):
+    """
+    迴圈不變量外提 (LICM)：運算元都是常數、迴圈裡沒被指定的變數或已經提出去的結果，
+    而且結果在迴圈裡只被指定一次、迴圈開始和離開時都不需要舊值的運算，移到前置區塊只算一次。
+    提出去的運算不管原本的區塊會不會執行都會先算，所以不能多出執行時的錯誤：
+    除數不是非零常數的除法不提出去 (除以 0)，讀的變數在前置區塊結束時也要一定設定過。
+    """
+    found = _loop(ir_code, header_label)
+    if found is None:
+        return ir_code
+    graph, body, header, indices, blocked = found
+    code = ir_code
+    defs = _defs(code, indices)
+    _, assigned_out = graph.assigned()
+    assigned = assigned_out[header - 1] # _loop 確定了前置區塊就是 header 的前一個區塊
+    hoisted, invariant = [], set()
+    changed = True
+    while changed:
+        changed = False
+        for i in indices:
+            quad = code[i]
+            op, _, a2, target = quad
+            if i in hoisted or not (op in BINARY_OPS or op == '='):
+                continue
+            if defs[target] != 1 or blocked >> graph.index[target] & 1:
+                continue
+            if op == '/' and not (is_const(a2) and int(a2) != 0):
+                continue
+            if all(is_const(quad[k]) or quad[k] in invariant
+                   or quad[k] not in defs and assigned >> graph.index[quad[k]] & 1 for k in reads(quad)):
+                hoisted.append(i)
+                invariant.add(target)
+                changed = True
+    if not hoisted:
+        return ir_code
+    start = graph.blocks[header][0]
+    moved = set(hoisted)
+    return (code[:start] + [code[i] for i in hoisted]
+            + [quad for i, quad in enumerate(code[start:], start) if i not in moved])
+
+def reduce_strength(ir_code, header_label):
+    """
+    歸納變數的強度折減：
+    * 基本歸納變數 i：迴圈裡唯一的指定是 i = i + c (c 為常數)，每一圈都會執行
+    * 衍生歸納變數 j：迴圈裡唯一的指定是 j = x * k、x + d、x - d 或 x (k、d 為常數，
+      x 是歸納變數)，也就是第 n 圈算出來的 j 等於 a * (i0 + (n + p) * c) + b，
+      p 是讀 i 的地方在 i += c 之前 (0) 還是之後 (1)
+    j 原本的指定改成 j += a * c，乘法變成加法；前置區塊先算好 j 在第 -1 圈的值
+    (照原本的運算算出 a * i0 + b，p 為 0 時再減掉 a * c)，所以每一圈讀到的 j 都和原本相同。
+    只用來算其他衍生變數的 j (例如 i * 4 + 2 的 i * 4) 不必再加，整個消失。
+
+    j 的指定要在每一圈剛好執行一次的區塊：支配所有跳回開頭的區塊，而且不在內層迴圈裡
+    (內層迴圈開頭的區塊也支配外層的 latch，但一圈會執行好幾次)，否則一圈可能加了好幾次或沒加到。
+    """
+    found = _loop(ir_code, header_label)
+    if found is None:
+        return ir_code
+    graph, body, header, indices, blocked = found
+    code = ir_code
+    live_in, _ = graph.liveness()
+    defs = _defs(code, indices)
+    def_at = {written(code[i]): i for i in indices if written(code[i]) is not None}
+    latches = [b for b, h in graph.back_edges() if h == header]
+    nested = set()
+    for inner, inner_body in graph.natural_loops().items():
+        if inner != header and inner in body:
+            nested |= inner_body
+
+    def every_iteration(index):
+        b = graph.block_of[index]
+        return b not in nested and all(graph.dominates(b, latch) for latch in latches)
+
+    basic = {} # i -> (遞增指令的索引, c)
+    for var, count in defs.items():
+        op, a1, a2, target = code[def_at[var]]
+        if count != 1 or not live_in[header] >> graph.index[var] & 1 or not every_iteration(def_at[var]):
+            continue
+        if op == '+' and a1 == target and is_const(a2):
+            basic[var] = (def_at[var], int(a2))
+        elif op == '+' and a2 == target and is_const(a1):
+            basic[var] = (def_at[var], int(a1))
+        elif op == '-' and a1 == target and is_const(a2):
+            basic[var] = (def_at[var], -int(a2))
+
+    def after_increment(index, base):
+        # 兩個都支配跳回開頭的區塊，所以一定是其中一個先執行
+        increment = basic[base][0]
+        if graph.block_of[index] == graph.block_of[increment]:
+            return index > increment
+        return graph.dominates(graph.block_of[increment], graph.block_of[index])
+
+    def family(x, index):
+        if x in basic:
+            return (x, 1, after_increment(index, x))
+        return derived.get(x)
+
+    derived = {} # j -> (基本歸納變數 i, a, p)
+    order = []
+    changed = True
+    while changed:
+        changed = False
+        for i in indices:
+            op, a1, a2, target = code[i]
+            if target in derived or target in basic or defs.get(target) != 1:
+                continue
+            if blocked >> graph.index[target] & 1 or not every_iteration(i):
+                continue
+            scale = None
+            if op == '*':
+                for x, k in ((a1, a2), (a2, a1)):
+                    if family(x, i) and is_const(k):
+                        base, a, p = family(x, i)
+                        scale = (base, a * int(k), p)
+                        break
+            elif op == '+':
+                for x, d in ((a1, a2), (a2, a1)):
+                    if family(x, i) and is_const(d):
+                        scale = family(x, i)
+                        break
+            elif op == '-' and family(a1, i) and is_const(a2):
+                scale = family(a1, i)
+            elif op == '=' and family(a1, i):
+                scale = family(a1, i)
+            if scale is not None:
+                derived[target] = scale
+                order.append(i)
+                changed = True
+    if not derived:
+        return ir_code
+    moved = set(order)
+    # 還有其他指令 (不是移出去的那些) 讀取的衍生變數才需要留在迴圈裡每圈加一次
+    used = {code[i][k] for i in indices if i not in moved for k in reads(code[i])}
+    preheader = [code[i] for i in order]
+    bumps = {}
+    for i in order:
+        j = code[i][3]
+        base, a, p = derived[j]
+        if j in used:
+            step = a * basic[base][1]
+            bumps[i] = ('+', j, str(step), j)
+            if not p:
+                preheader.append(('-', j, str(step), j))
+    start = graph.blocks[header][0]
+    new = code[:start] + preheader
+    for i in range(start, len(code)):
+        if i in bumps:
+            new.append(bumps[i])
+        elif i not in moved:
+            new.append(code[i])
+    return new
+
+def _name_loop_temps(ir_code):
+    """
+    迴圈最佳化之後，有些暫存變數會跨越區塊 (提出去的結果、跟著 i 加的衍生變數)，
+    改成 $l0、$l1 ... 這種一般變數的名稱 (一樣以 $ 開頭，不會和使用者的變數撞名)，其他 pass 才不會把它們當成區塊內的暫存變數。
+    """
+    carried = set()
+    for start, end in basic_blocks(ir_code):
+        assigned = set()
+        for quad in ir_code[start:end]:
+            carried.update(quad[k] for k in reads(quad) if TEMP.match(quad[k]) and quad[k] not in assigned)
+            target = written(quad)
+            if target is not None:
+                assigned.add(target)
+    if not carried:
+        return ir_code
+    count = max([int(quad[3][2:]) + 1 for quad in ir_code if re.match(r'\$l\d+$', quad[3])], default=0)
+    names = {}
+    for temp in sorted(carried, key=lambda t: int(t[2:])):
+        names[temp] = f"$l{count}"
+        count += 1
+    return [tuple(names.get(arg, arg) if k else arg for k, arg in enumerate(quad)) for quad in ir_code]
+
+def optimize_loops(ir_code):
+    """對每個 while 迴圈 (由內而外) 做不變量外提和強度折減，見 hoist_invariants、reduce_strength"""
+    graph = CFG(ir_code)
+    loops = graph.natural_loops()
+    headers = [graph.code[graph.blocks[h][0]][1] for h in sorted(loops, key=lambda h: len(loops[h]))
+               if graph.code[graph.blocks[h][0]][0] == 'label']
+    code = list(ir_code)
+    for label in headers:
+        code = hoist_invariants(code, label)
+        code = reduce_strength(code, label)
+    return _name_loop_temps(code)
+
+# 各最佳化等級執行的 pass (依序執行，直到程式不再改變)
+PASSES = {
+    0: [],
+    1: [fold_constants, propagate_copies, remove_dead_temps],
+    2: [fold_constants, eliminate_common_subexpressions, propagate_copies, remove_dead_temps,
+        remove_dead_stores],
+    3: [fold_constants, eliminate_common_subexpressions, propagate_copies, remove_dead_temps,
+        remove_dead_stores, optimize_loops],
+}
+
+def optimize(ir_code, level=2, max_rounds=10):
+    if not PASSES[level]:
+        return list(ir_code)
+    code = split_temps(ir_code)
+    for _ in range(max_rounds):
+        before = code
+        for optimization in PASSES[level]:
+            code = optimization(code)
+        if code == before:
+            break
+    return pack_temps(code)
+
+def count_steps(ir_code):
+    """在 VM 上執行 (不印訊息)，傳回 (輸出, 執行的指令數)"""
+    from vm import VirtualMachine
+    vm = VirtualMachine(ir_code, quiet=True)
+    outputs = vm.run()
+    return outputs, vm.steps
+
+# run: python optimizer.py <原始碼.p0|中間碼.ir> ...   (比較各最佳化等級的指令數與 VM 執行的指令數)
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("用法: python optimizer.py <原始碼.p0|中間碼.ir> ...")
+        sys.exit(1)
+    from compiler import Compiler
+    from vm import load_ir_from_file
+    failed = 0
+    for filename in sys.argv[1:]:
+        if filename.endswith('.p0'):
+            with open(filename, 'r', encoding='utf-8') as f:
+                compiler = Compiler(f.read())
+            compiler.parse_program()
+            ir_code = compiler.ir_code
+        else:
+            ir_code = load_ir_from_file(filename)
+        print(filename)
+        expected, base = count_steps(ir_code)
+        for level in sorted(PASSES):
+            code = optimize(ir_code, level)
+            outputs, steps = count_steps(code)
+            failed += outputs != expected
+            print(f"  -O{level}  {len(code):>6} quads  {steps:>10} steps  {100 * steps / base:6.1f}%"
+                  f"  {'ok' if outputs == expected else 'FAIL'}")
+    sys.exit(1 if failed else 0)
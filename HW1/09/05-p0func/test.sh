@@ -2,4 +2,37 @@ python compiler.py p0/test1.p0 > p0/test1.ir
 python vm.py p0/test1.ir
 
 python compiler.py p0/test2.p0 > p0/test2.ir
-python vm.py p0/test2.ir
\ No newline at end of file
+python vm.py p0/test2.ir
+
+python compiler.py p0/fib.p0 > p0/fib.ir
+python vm.py p0/fib.ir
+
+python compiler.py p0/args.p0 > p0/args.ir
+python vm.py p0/args.ir
+
+python compiler.py p0/loop.p0 > p0/loop.ir
+python vm.py --jit p0/loop.ir
+python jit.py p0/loop.ir
+
+python compiler.py p0/tail.p0 > p0/tail.ir
+python vm.py p0/tail.ir
+
+python compiler.py p0/fib.p0 p0/fib.irb
+python vm.py p0/fib.irb
+
+python compiler.py p0/collatz.p0 > p0/collatz.ir
+python batch.py p0/collatz.ir n=1:10001 --compare
+
+python compiler.py p0/expr.p0 > p0/expr.ir
+python compiler.py -O p0/expr.p0 p0/expr.irb
+python vm.py p0/expr.irb
+python optimizer.py p0/expr.p0 p0/loop.p0 p0/licm.p0 p0/induction.p0 p0/nested.p0 p0/guarded.p0
+
+python compiler.py p0/prec.p0 > p0/prec.ir
+python vm.py p0/prec.ir
+
+python cfg.py p0/*.p0
+
+python compiler.py p0/licm.p0 > p0/licm.ir
+python compiler.py -O3 p0/licm.p0 p0/licm.irb
+python vm.py p0/licm.irb
@@ -1,24 +1,239 @@
+import json
 import operator
-import ast
+import sys
+import time
+
+import irfile
+from cfg import CFG
+
+# 載入時把四元組轉成整數運算碼，執行迴圈不必再比對字串
+ADD, SUB, MUL, DIV, LE, EQ, MOVE, PRINT, GOTO, IF_FALSE, NOP, PARAM, CALL, RECV, RETURN, TAILCALL = range(16)
+
+MAX_DEPTH = 100000 # 預設的最大呼叫深度
+
+OPCODES = {
+    '+': ADD, '-': SUB, '*': MUL, '/': DIV, '<=': LE, '==': EQ,
+    '=': MOVE, 'print': PRINT, 'goto': GOTO, 'if_false': IF_FALSE,
+    'label': NOP, 'func_entry': NOP,
+    'param': PARAM, 'call': CALL, 'recv': RECV, 'return': RETURN,
+}
+
+def equal(x, y):
+    # None == 0 不會出錯，沒設定過的變數 (None) 要自己丟出 TypeError，才會和其他運算一樣報出變數名稱
+    if x is None or y is None:
+        raise TypeError
+    return 1 if x == y else 0
+
+# 算術與比較 (ADD..EQ)，比較結果轉為 1/0
+BINARY = [
+    operator.add,
+    operator.sub,
+    operator.mul,
+    operator.floordiv, # 假設整數除法
+    lambda x, y: 1 if x <= y else 0,
+    equal,
+]
+
+def operand(arg):
+    """預先分類運算元：傳回 (值, 是否為變數)，數字字串在這裡就轉成 int"""
+    if arg is None or arg == '-':
+        return None, False
+    try:
+        return int(arg), False
+    except ValueError:
+        return arg, True
+
+class Scope:
+    """
+    一個函數 (或主程式) 的變數配置：每個變數、暫存變數和常數都有固定的槽位 (slot)，
+    frame 就是一個 list，常數在 template 裡已經放好，所以讀運算元一律是 frame[slot]。
+    """
+    def __init__(self, name):
+        self.name = name
+        self.slots = {}    # 變數名稱或 ('const', 值) -> 槽位
+        self.template = [] # 新 frame 的初始內容：變數為 None，常數為其值
+        self.pool = []     # 回收的 frame，遞迴呼叫時重複使用，不必每次配置
+        self.nparams = 0   # 參數個數，參數固定放在槽位 0..nparams-1
+
+    def param(self, name):
+        # 參數必須最先配置槽位，call 才能用一次 slice 把引數放進 frame
+        if self.slot(name) != self.nparams:
+            raise ValueError(f"parameters of '{self.name}' must be received right after its func_entry")
+        self.nparams += 1
+
+    def slot(self, arg):
+        value, is_var = operand(arg)
+        if value is None:
+            return None
+        key = value if is_var else ('const', value)
+        if key not in self.slots:
+            self.slots[key] = len(self.template)
+            self.template.append(None if is_var else value)
+        return self.slots[key]
+
+    def name_of(self, slot):
+        for key, index in self.slots.items():
+            if index == slot:
+                return key if isinstance(key, str) else str(key[1])
+        return f'#{slot}'
+
+class Output:
+    """
+    print 指令的輸出目的地。值先累積在 buffer，滿 batch 筆或 flush() 時才一次交給 target：
+    檔案類物件 (sys.stdout、io.StringIO、open() 的檔案) 寫入格式化後的文字，
+    list 直接 extend，其他可呼叫物件以值的 list 呼叫。target 為 None 時只收集不輸出，
+    values 就是所有輸出的值。
+    """
+    def __init__(self, target=None, batch=1024, fmt=">> OUTPUT: {}\n"):
+        self.target = target
+        self.fmt = fmt
+        self.buffer = []
+        self.limit = float('inf') if target is None else batch
+
+    @property
+    def values(self):
+        return self.buffer if self.target is None else None
+
+    def emit(self, value):
+        self.buffer.append(value)
+        if len(self.buffer) >= self.limit:
+            self.flush()
+
+    def flush(self):
+        target, buffer = self.target, self.buffer
+        if target is None or not buffer:
+            return
+        if hasattr(target, 'write'):
+            target.write(''.join(self.fmt.format(value) for value in buffer))
+        elif isinstance(target, list):
+            target.extend(buffer)
+        else:
+            target(list(buffer))
+        buffer.clear()
+
+class Profile:
+    """
+    run_profiled() 的統計：每個指令的執行次數、每個函數的呼叫次數與 (含被呼叫者的) 時間、
+    最大呼叫深度，以及建立與重複使用的 frame 數。
+    """
+    def __init__(self, size):
+        self.counts = [0] * size # 指令索引 -> 執行次數
+        self.calls = {}          # 函數名稱 -> 呼叫次數
+        self.times = {}          # 函數名稱 -> 含被呼叫者的時間 (遞迴只算最外層)
+        self.max_depth = 0
+        self.frames_created = 0
+        self.frames_reused = 0
+        self.elapsed = 0.0
+
+    def functions(self, vm):
+        # 各函數執行的指令數由指令計數加總而來，執行時不必另外計數
+        executed = {}
+        for index, count in enumerate(self.counts):
+            name = vm.scope_of[index].name
+            executed[name] = executed.get(name, 0) + count
+        rows = []
+        for name, count in executed.items():
+            time_ = self.elapsed if name == '<main>' else self.times.get(name, 0.0)
+            rows.append((name, self.calls.get(name, 0), count, time_))
+        return sorted(rows, key=lambda row: -row[3])
+
+    def hot_spots(self, vm, top=10):
+        order = sorted(range(len(self.counts)), key=lambda i: -self.counts[i])
+        return [(i, self.counts[i], vm.code[i]) for i in order[:top] if self.counts[i]]
+
+    def report(self, vm, top=10):
+        total = sum(self.counts)
+        lines = [f"{total} instructions in {self.elapsed:.4f}s, max depth {self.max_depth}, "
+                 f"frames created {self.frames_created} reused {self.frames_reused}",
+                 f"{'function':<16} {'calls':>10} {'instructions':>14} {'time (s)':>10}"]
+        for name, calls, count, time_ in self.functions(vm):
+            lines.append(f"{name:<16} {calls:>10} {count:>14} {time_:>10.4f}")
+        lines.append(f"{'ip':>6} {'count':>10} {'%':>6}  instruction")
+        for index, count, quad in self.hot_spots(vm, top):
+            lines.append(f"{index:>6} {count:>10} {100 * count / total:>6.2f}  {' '.join(quad)}")
+        return '\n'.join(lines)
+
+    def to_dict(self, vm, top=10):
+        return {
+            'instructions': sum(self.counts),
+            'elapsed': self.elapsed,
+            'max_depth': self.max_depth,
+            'frames_created': self.frames_created,
+            'frames_reused': self.frames_reused,
+            'functions': [{'name': name, 'calls': calls, 'instructions': count, 'time': time_}
+                          for name, calls, count, time_ in self.functions(vm)],
+            'hot_spots': [{'ip': index, 'count': count, 'instruction': list(quad)}
+                          for index, count, quad in self.hot_spots(vm, top)],
+            'counts': self.counts,
+        }
 
 class VirtualMachine:
-    def __init__(self, ir_code):
+    def __init__(self, ir_code, max_depth=MAX_DEPTH, output=None, quiet=False, free_dead=False):
         self.code = ir_code           # 四元組指令集
         self.ip = 0                   # 指令指標 (Instruction Pointer)
-        
+        self.max_depth = max_depth    # ret_stack 超過這個深度就停止 (RecursionError)
+
+        # print 的輸出 (見 Output)：預設寫到 stdout；quiet 時不印開始/結束訊息，
+        # 沒指定 output 就只收集輸出值，由 run() 傳回
+        self.quiet = quiet
+        if not isinstance(output, Output):
+            output = Output(output if output is not None or quiet else sys.stdout)
+        self.output = output
+
+        # 標籤查找表
+        self.labels = self._scan_labels()
+
+        # 每個指令屬於哪個 Scope (主程式或某個函數)，以及預先轉換好的指令
+        self.scope_of = self._scan_scopes()
+        self.program = self._compile()
+
+        # free_dead: 依 cfg.py 的活躍變數分析，call 時先把呼叫者之後不會再讀的槽位清成 None，
+        # 等待返回的 frame 只留下還會用到的值。call 的指令索引 -> 要清掉的槽位
+        self.dead_at_call = self._scan_dead_slots() if free_dead else {}
+
         # 函數呼叫堆疊 (Call Stack)
-        # 每個元素是一個字典，代表該函數的區域變數環境 (Local Scope)
-        # 預設有一個全域環境 (Global Scope)
-        self.environment = [{}] 
-        
-        # 儲存 (return_ip, return_target_var) 的堆疊
+        # 每個元素是一個 frame (list)，代表該函數的區域變數，底部是主程式的 frame
+        main = self.scope_of[0] if self.code else Scope('<main>')
+        self.environment = [main.template[:]]
+
+        # 儲存 (return_ip, 接收回傳值的槽位, 被呼叫函數的 frame 回收區) 的堆疊
         self.ret_stack = []
-        
-        # 參數緩衝區 (用於 param 指令暫存參數)
+
+        # 參數堆疊 (param 指令推入，call 一次取走最上面的 n 個)
         self.args_buffer = []
-        
-        # 標籤查找表
-        self.labels = self._scan_labels()
+
+        self.steps = 0         # 已執行的指令數 (run() 可以分段執行，見 max_steps)
+        self.started = False   # 是否已經印過開始訊息
+
+    @property
+    def done(self):
+        # 主程式 return 時 ip 會設成程式長度，所以只要看 ip
+        return self.ip >= len(self.program)
+
+    def _begin(self):
+        if not self.started:
+            self.started = True
+            if not self.quiet:
+                print(f"{'Executing IR':=^30}")
+
+    def _finish(self):
+        if self.done and not self.quiet:
+            print(f"{'Execution Finished':=^30}")
+
+    def snapshot(self):
+        """
+        複製目前的執行狀態 (ip、所有 frame、ret_stack、參數堆疊、指令數)，之後可以用 restore() 回到這裡。
+        已經輸出的值不會收回。
+        """
+        return (self.ip, [frame[:] for frame in self.environment], self.ret_stack[:],
+                self.args_buffer[:], self.steps)
+
+    def restore(self, state):
+        ip, environment, ret_stack, args_buffer, steps = state
+        self.ip, self.steps = ip, steps
+        self.environment[:] = [frame[:] for frame in environment]
+        self.ret_stack[:] = ret_stack
+        self.args_buffer[:] = args_buffer
 
     def _scan_labels(self):
         """預先掃描所有 label 和 func_entry 的位置"""
@@ -29,142 +244,454 @@ class VirtualMachine:
                 labels[arg1] = index
         return labels
 
-    def _get_val(self, arg):
-        """取得數值：如果是數字字串則轉 int，如果是變數則從當前環境查找"""
-        if arg is None or arg == '-':
-            return None
-        # 嘗試轉換為數字
-        try:
-            return int(arg)
-        except ValueError:
-            # 查找變數 (從堆疊頂端的環境找)
-            env = self.environment[-1]
-            if arg in env:
-                return env[arg]
-            else:
-                raise ValueError(f"Variable '{arg}' not defined in current scope {env}")
-
-    def _set_val(self, name, value):
-        """設定變數值到當前環境"""
-        self.environment[-1][name] = value
-
-    def run(self):
-        ops = {
-            '+': operator.add,
-            '-': operator.sub,
-            '*': operator.mul,
-            '/': operator.floordiv, # 假設整數除法
-            '<=': operator.le,
-            '==': operator.eq,
-        }
+    def _target(self, name):
+        # 跳躍目標直接解析成索引；label 本身不做事，所以跳到它的下一行
+        if name not in self.labels:
+            raise ValueError(f"Undefined label '{name}'")
+        return self.labels[name] + 1
 
-        print(f"{'Executing IR':=^30}")
-        
-        while self.ip < len(self.code):
-            op, arg1, arg2, result = self.code[self.ip]
-            
-            # Debug 訊息 (可選)
-            # print(f"IP:{self.ip:02d} | {op} {arg1} {arg2} {result} | Env: {self.environment[-1]}")
-
-            if op in ops:
-                # 數學與邏輯運算
-                v1 = self._get_val(arg1)
-                v2 = self._get_val(arg2)
-                res = ops[op](v1, v2)
-                # 將布林值轉為 1/0
-                if isinstance(res, bool):
-                    res = 1 if res else 0
-                self._set_val(result, res)
-                self.ip += 1
-
-            elif op == '=':
-                # 賦值
-                val = self._get_val(arg1)
-                self._set_val(result, val)
-                self.ip += 1
-
-            elif op == 'print':
-                val = self._get_val(arg1)
-                print(f">> OUTPUT: {val}")
-                self.ip += 1
-
-            elif op == 'goto':
-                self.ip = self.labels[arg1]
-
-            elif op == 'if_false':
-                cond = self._get_val(arg1)
-                if cond == 0: # False
-                    self.ip = self.labels[result]
+    def _scan_scopes(self):
+        """
+        從主程式入口 (索引 0) 和每個 func_entry 沿著控制流程走，找出每個指令屬於哪個函數。
+        同一段程式碼被兩個入口走到時 (例如主程式直接落入函數)，兩者合併成同一個 Scope。
+        """
+        code = self.code
+        entries = [0] + [i for i, quad in enumerate(code) if quad[0] == 'func_entry']
+        owner = [None] * len(code)
+        parent = list(range(len(entries)))
+        def find(s):
+            while parent[s] != s:
+                s = parent[s]
+            return s
+        for s, entry in enumerate(entries):
+            stack = [entry]
+            while stack:
+                i = stack.pop()
+                if i >= len(code):
+                    continue
+                if owner[i] is not None:
+                    parent[find(owner[i])] = find(s)
+                    continue
+                owner[i] = s
+                op, arg1, _, result = code[i]
+                if op == 'goto':
+                    stack.append(self._target(arg1))
+                elif op == 'if_false':
+                    stack.extend((i + 1, self._target(result)))
+                elif op != 'return':
+                    stack.append(i + 1)
+        scopes = {}
+        for s, entry in enumerate(entries):
+            root = find(s)
+            if root not in scopes:
+                scopes[root] = Scope(code[entries[root]][1] if root else '<main>')
+        # 走不到的指令 (死碼) 歸給主程式
+        return [scopes[find(s if s is not None else 0)] for s in owner]
+
+    def _compile(self):
+        """
+        把每個四元組 (op, arg1, arg2, result) 轉成 (opcode, a, b, c)：
+        運算元已換成所屬 Scope 的槽位，跳躍目標已換成指令索引，
+        call 的 b 是被呼叫函數的 Scope (用來建立 frame)。
+
+        call f n tK 緊接著 return tK 的是尾呼叫，改成 TAILCALL (c 是呼叫者的 Scope)：
+        不推入返回地址，被呼叫函數直接回到呼叫者的呼叫者，所以尾遞迴只用固定的記憶體。
+        """
+        code = self.code
+        # 先配置每個函數的參數槽位：func_entry 之後連續的 recv 依序是參數 0, 1, 2 ...
+        received = set()
+        for index, (op, arg1, _, _) in enumerate(code):
+            if op == 'func_entry':
+                scope = self.scope_of[index]
+                if scope.nparams:
+                    raise ValueError(f"function '{arg1}' shares its code with '{scope.name}'")
+                i = index + 1
+                while i < len(code) and code[i][0] == 'recv':
+                    scope.param(code[i][1])
+                    received.add(i)
+                    i += 1
+        program = []
+        for index, (op, arg1, arg2, result) in enumerate(code):
+            if op not in OPCODES:
+                raise ValueError(f"Unknown instruction: {op}")
+            opcode = OPCODES[op]
+            scope = self.scope_of[index]
+            if opcode == GOTO:
+                program.append((opcode, self._target(arg1), None, None))
+            elif opcode == IF_FALSE:
+                program.append((opcode, scope.slot(arg1), None, self._target(result)))
+            elif opcode == CALL:
+                # 直接跳過函數開頭的 recv (引數在 call 時已經放進 frame)
+                entry = self._target(arg1)
+                callee = self.scope_of[entry - 1]
+                if arg2 != '-' and int(arg2) != callee.nparams:
+                    raise ValueError(f"call {arg1}: expects {callee.nparams} arguments, got {arg2}")
+                following = code[index + 1] if index + 1 < len(code) else None
+                if result != '-' and following is not None and following[0] == 'return' and following[1] == result:
+                    program.append((TAILCALL, entry + callee.nparams, callee, scope))
                 else:
-                    self.ip += 1
-
-            elif op == 'label' or op == 'func_entry':
-                # 標籤不執行任何動作
-                self.ip += 1
-
-            # --- 函數呼叫相關指令 ---
-            
-            elif op == 'param':
-                # 將參數值推入緩衝區
-                val = self._get_val(arg1)
-                self.args_buffer.append(val)
-                self.ip += 1
-
-            elif op == 'call':
-                func_name = arg1
-                # arg2 是參數數量 (此處 VM 實作可以依賴 args_buffer，暫不使用計數)
-                target_var = result # 函數回傳後要存入的變數名
-
-                # 1. 記錄返回地址 (下一行指令) 和 接收回傳值的變數
-                self.ret_stack.append((self.ip + 1, target_var))
-                
-                # 2. 建立新的執行環境 (Scope)
-                self.environment.append({})
-                
-                # 3. 跳轉到函數入口
-                self.ip = self.labels[func_name]
-
-            elif op == 'recv':
-                # 從緩衝區取出參數，存入當前環境的變數中
-                # FIFO: 先 param 的先 recv
-                val = self.args_buffer.pop(0) 
-                self._set_val(arg1, val)
-                self.ip += 1
-
-            elif op == 'return':
-                # 1. 計算回傳值
-                ret_val = self._get_val(arg1) if arg1 != '-' else None
-                
-                # 2. 銷毀當前環境
-                self.environment.pop()
-                
-                # 3. 恢復上一層狀態
-                if self.ret_stack:
-                    ret_ip, target_var = self.ret_stack.pop()
-                    self.ip = ret_ip
+                    program.append((opcode, entry + callee.nparams, callee, scope.slot(result)))
+            elif opcode == RECV:
+                if index not in received:
+                    raise ValueError(f"recv {arg1} is not at the entry of a function")
+                program.append((NOP, None, None, None))
+            elif opcode == NOP:
+                program.append((opcode, None, None, None))
+            else:
+                program.append((opcode, scope.slot(arg1), scope.slot(arg2), scope.slot(result)))
+        return program
+
+    def _scan_dead_slots(self):
+        graph = CFG(self.code)
+        live_after = graph.live_after()
+        dead = {}
+        for index, quad in enumerate(self.code):
+            if self.program[index][0] != CALL:
+                continue
+            scope = self.scope_of[index]
+            slots = tuple(slot for name, slot in scope.slots.items()
+                          if isinstance(name, str) and name != quad[3]
+                          and not live_after[index] >> graph.index[name] & 1)
+            if slots:
+                dead[index] = slots
+        return dead
+
+    def run(self, max_steps=None):
+        """
+        執行到程式結束，或執行滿 max_steps 個指令就先停下來 (此時 done 為 False，
+        之後再呼叫 run() 會從停下的地方繼續)。傳回收集到的輸出值 (見 Output)。
+        """
+        if self.done:
+            return self.output.values
+        self._begin()
+
+        program = self.program
+        size = len(program)
+        binary = BINARY
+        max_depth = self.max_depth
+        environment, ret_stack, args_buffer = self.environment, self.ret_stack, self.args_buffer
+        dead_at_call = self.dead_at_call
+        output = self.output
+        out, limit = output.buffer, output.limit
+        env = environment[-1]
+        ip = self.ip
+        budget = float('inf') if max_steps is None else max_steps
+        steps = 0
+        try:
+            while ip < size and steps < budget:
+                op, a, b, c = program[ip]
+                ip += 1
+                steps += 1
+
+                if op <= EQ:
+                    # 數學與邏輯運算
+                    env[c] = binary[op](env[a], env[b])
+
+                elif op == MOVE:
+                    # 賦值 (沒設定過的變數是 None，丟出 TypeError 交給下面報出變數名稱)
+                    if env[a] is None:
+                        raise TypeError
+                    env[c] = env[a]
+
+                elif op == IF_FALSE:
+                    if env[a] == 0: # False
+                        ip = c
+                    elif env[a] is None:
+                        raise TypeError
+
+                elif op == GOTO:
+                    ip = a
+
+                elif op == NOP:
+                    # 標籤不執行任何動作
+                    pass
+
+                # --- 函數呼叫相關指令 ---
+
+                elif op == PARAM:
+                    # 將參數值推入參數堆疊
+                    if env[a] is None:
+                        raise TypeError
+                    args_buffer.append(env[a])
+
+                elif op == CALL:
+                    # 記錄返回地址 (下一行指令)、接收回傳值的槽位和 frame 回收區，
+                    # 從回收區拿一個 frame (沒有才配置新的) 後跳到函數入口
+                    if len(ret_stack) >= max_depth:
+                        raise RecursionError(f"call depth exceeded {max_depth} (calling {b.name})")
+                    if dead_at_call:
+                        for slot in dead_at_call.get(ip - 1, ()):
+                            env[slot] = None
+                    ret_stack.append((ip, c, b.pool))
+                    if b.pool:
+                        env = b.pool.pop()
+                        env[:] = b.template
+                    else:
+                        env = b.template[:]
+                    # 參數堆疊最上面的 n 個就是這次呼叫的引數 (巢狀呼叫的引數已被內層 call 取走)
+                    n = b.nparams
+                    if n:
+                        if len(args_buffer) < n:
+                            raise IndexError(f"call needs {n} arguments, only {len(args_buffer)} passed")
+                        env[:n] = args_buffer[-n:]
+                        del args_buffer[-n:]
+                    environment.append(env)
+                    ip = a
+
+                elif op == TAILCALL:
+                    # 先取出引數，再重複使用目前的 frame (遞迴) 或換成被呼叫函數的 frame
+                    n = b.nparams
+                    if len(args_buffer) < n:
+                        raise IndexError(f"call needs {n} arguments, only {len(args_buffer)} passed")
+                    if b is not c:
+                        c.pool.append(env)
+                        env = b.pool.pop() if b.pool else b.template[:]
+                        environment[-1] = env
+                    env[:] = b.template
+                    if n:
+                        env[:n] = args_buffer[-n:]
+                        del args_buffer[-n:]
+                    ip = a
+
+                elif op == RETURN:
+                    ret_val = env[a] if a is not None else None
+                    if ret_val is None and a is not None:
+                        raise TypeError
+                    if not ret_stack:
+                        # 堆疊為空，代表程式結束 (主程式 return)
+                        environment.pop()
+                        ip = size
+                        break
+                    ip, target, pool = ret_stack.pop()
+                    pool.append(environment.pop())
+                    env = environment[-1]
                     # 如果有變數需要接收回傳值
-                    if target_var != '-' and ret_val is not None:
-                        self._set_val(target_var, ret_val)
-                else:
-                    # 堆疊為空，代表程式結束 (主程式 return)
-                    break
+                    if target is not None and ret_val is not None:
+                        env[target] = ret_val
 
-            else:
-                raise ValueError(f"Unknown instruction: {op}")
+                elif op == PRINT:
+                    if env[a] is None:
+                        raise TypeError
+                    out.append(env[a])
+                    if len(out) >= limit:
+                        output.flush()
+        except TypeError:
+            # 讀到還沒設定的變數 (槽位是 None) 才會讓運算出錯
+            self.ip = ip - 1
+            self._undefined(env, program[ip - 1])
+            raise
+        except Exception:
+            self.ip = ip - 1
+            raise
+        finally:
+            self.steps += steps
+            output.flush()
+        self.ip = ip
+
+        self._finish()
+        return output.values
+
+    def run_profiled(self, profile=None):
+        """
+        與 run() 相同，但記錄 Profile 統計後傳回。統計放在這個獨立的迴圈裡，
+        所以一般的 run() 完全不受影響。
+        """
+        profile = profile or Profile(len(self.program))
+        counts, calls, times = profile.counts, profile.calls, profile.times
+        if self.done:
+            return profile
+        self._begin()
+
+        program = self.program
+        size = len(program)
+        binary = BINARY
+        max_depth = self.max_depth
+        environment, ret_stack, args_buffer = self.environment, self.ret_stack, self.args_buffer
+        dead_at_call = self.dead_at_call
+        output = self.output
+        out, limit = output.buffer, output.limit
+        env = environment[-1]
+        ip = self.ip
+        clock = time.perf_counter
+        started = [] # 與 ret_stack 對應：(函數名稱, 開始時間)
+        active = {}  # 函數名稱 -> 目前在堆疊中的層數 (遞迴時只計算最外層的時間)
+
+        def enter(scope):
+            calls[scope.name] = calls.get(scope.name, 0) + 1
+            active[scope.name] = active.get(scope.name, 0) + 1
+            started.append((scope.name, clock()))
+
+        def leave():
+            name, start = started.pop()
+            active[name] -= 1
+            if not active[name]:
+                times[name] = times.get(name, 0.0) + clock() - start
+
+        executed = sum(counts)
+        begin = clock()
+        try:
+            while ip < size:
+                counts[ip] += 1
+                op, a, b, c = program[ip]
+                ip += 1
+
+                if op <= EQ:
+                    env[c] = binary[op](env[a], env[b])
+
+                elif op == MOVE:
+                    if env[a] is None:
+                        raise TypeError
+                    env[c] = env[a]
+
+                elif op == IF_FALSE:
+                    if env[a] == 0:
+                        ip = c
+                    elif env[a] is None:
+                        raise TypeError
+
+                elif op == GOTO:
+                    ip = a
+
+                elif op == NOP:
+                    pass
+
+                elif op == PARAM:
+                    if env[a] is None:
+                        raise TypeError
+                    args_buffer.append(env[a])
 
-        print(f"{'Execution Finished':=^30}")
+                elif op == CALL:
+                    if len(ret_stack) >= max_depth:
+                        raise RecursionError(f"call depth exceeded {max_depth} (calling {b.name})")
+                    enter(b)
+                    for slot in dead_at_call.get(ip - 1, ()):
+                        env[slot] = None
+                    ret_stack.append((ip, c, b.pool))
+                    profile.max_depth = max(profile.max_depth, len(ret_stack))
+                    if b.pool:
+                        profile.frames_reused += 1
+                        env = b.pool.pop()
+                        env[:] = b.template
+                    else:
+                        profile.frames_created += 1
+                        env = b.template[:]
+                    n = b.nparams
+                    if n:
+                        if len(args_buffer) < n:
+                            raise IndexError(f"call needs {n} arguments, only {len(args_buffer)} passed")
+                        env[:n] = args_buffer[-n:]
+                        del args_buffer[-n:]
+                    environment.append(env)
+                    ip = a
+
+                elif op == TAILCALL:
+                    n = b.nparams
+                    if len(args_buffer) < n:
+                        raise IndexError(f"call needs {n} arguments, only {len(args_buffer)} passed")
+                    if started:
+                        leave()
+                    enter(b)
+                    if b is not c:
+                        c.pool.append(env)
+                        if b.pool:
+                            profile.frames_reused += 1
+                            env = b.pool.pop()
+                        else:
+                            profile.frames_created += 1
+                            env = b.template[:]
+                        environment[-1] = env
+                    else:
+                        profile.frames_reused += 1
+                    env[:] = b.template
+                    if n:
+                        env[:n] = args_buffer[-n:]
+                        del args_buffer[-n:]
+                    ip = a
+
+                elif op == RETURN:
+                    ret_val = env[a] if a is not None else None
+                    if ret_val is None and a is not None:
+                        raise TypeError
+                    if not ret_stack:
+                        environment.pop()
+                        ip = size
+                        break
+                    leave()
+                    ip, target, pool = ret_stack.pop()
+                    pool.append(environment.pop())
+                    env = environment[-1]
+                    if target is not None and ret_val is not None:
+                        env[target] = ret_val
+
+                elif op == PRINT:
+                    if env[a] is None:
+                        raise TypeError
+                    out.append(env[a])
+                    if len(out) >= limit:
+                        output.flush()
+        except TypeError:
+            self.ip = ip - 1
+            self._undefined(env, program[ip - 1])
+            raise
+        except Exception:
+            self.ip = ip - 1
+            raise
+        finally:
+            output.flush()
+            while started: # 執行中斷或結束時還沒 return 的函數
+                leave()
+            profile.elapsed += clock() - begin
+            self.steps += sum(counts) - executed
+        self.ip = ip
+
+        self._finish()
+        return profile
+
+    def _undefined(self, env, instruction):
+        # 只檢查指令讀取的運算元 (c 通常是寫入的目標)
+        scope = self.scope_of[self.ip]
+        op, a, b, _ = instruction
+        reads = (a, b) if op <= EQ else (a,) if op in (MOVE, IF_FALSE, PARAM, PRINT, RETURN) else ()
+        for slot in reads:
+            if slot is not None and env[slot] is None:
+                raise ValueError(f"Variable '{scope.name_of(slot)}' not defined in scope {scope.name}") from None
+
+def round_robin(vms, quantum=10000, max_steps=None):
+    """
+    在同一個 process 裡輪流執行多個 VM，每次最多 quantum 個指令。
+    執行超過 max_steps 個指令還沒結束的 VM 視為失控，不再執行。
+    傳回每個 VM 的結果：'finished' 或 'killed'。
+    """
+    status = [None] * len(vms)
+    running = list(range(len(vms)))
+    while running:
+        for i in list(running):
+            vm = vms[i]
+            steps = quantum if max_steps is None else min(quantum, max_steps - vm.steps)
+            vm.run(steps)
+            if vm.done:
+                status[i] = 'finished'
+            elif max_steps is not None and vm.steps >= max_steps:
+                status[i] = 'killed'
+            else:
+                continue
+            running.remove(i)
+    return status
 
 def load_ir_from_file(filename):
     """
-    讀取以空白分隔的中間碼檔案。
+    讀取以空白分隔的中間碼檔案，或 compiler.py 產生的二進位中間碼 (見 irfile.py)。
     
     格式範例:
     goto         L0         -          -
-    +            a          b          t0
+    +            a          b          $t0
     """
     ir_code = []
     
     try:
+        if irfile.is_binary(filename):
+            return irfile.load_ir(filename)
+
         with open(filename, 'r', encoding='utf-8') as f:
             for line_num, line in enumerate(f, 1):
                 # 1. 去除整行前後的空白
@@ -199,14 +726,28 @@ def load_ir_from_file(filename):
 # --- 程式碼執行區塊 (Main) ---
 
 if __name__ == "__main__":
-    import sys
+    # --jit: 改用 jit.py 的區塊編譯執行
+    # --profile: 執行後印出熱點報告；--profile=檔名.json 則把統計寫成 JSON (使用直譯迴圈)
+    # --max-steps=N: 最多執行 N 個指令 (避免無窮迴圈)
+    args = sys.argv[1:]
+    use_jit = '--jit' in args
+    if use_jit:
+        args.remove('--jit')
+    profile_to = max_steps = None
+    for arg in args[:]:
+        if arg.startswith('--profile'):
+            profile_to = arg.partition('=')[2] or '-'
+            args.remove(arg)
+        elif arg.startswith('--max-steps='):
+            max_steps = int(arg.partition('=')[2])
+            args.remove(arg)
     # 檢查是否提供了檔案路徑參數
-    if len(sys.argv) != 2:
-        print("用法: python vm.py <中間碼檔案路徑>")
+    if len(args) != 1:
+        print("用法: python vm.py [--jit] [--profile[=檔名.json]] [--max-steps=N] <中間碼檔案路徑>")
         sys.exit(1)
     
     # 從命令列參數中取得檔案路徑
-    ir_file_path = sys.argv[1]
+    ir_file_path = args[0]
     
     # 讀取中間碼
     ir_code_data = load_ir_from_file(ir_file_path)
@@ -215,7 +756,26 @@ if __name__ == "__main__":
         print(f"成功讀取 {len(ir_code_data)} 條指令。開始執行...")
         
         # 實例化並運行虛擬機
-        vm = VirtualMachine(ir_code_data)
-        vm.run()
+        if use_jit and profile_to is None:
+            from jit import JitVirtualMachine
+            vm = JitVirtualMachine(ir_code_data)
+        else:
+            vm = VirtualMachine(ir_code_data)
+        try:
+            if profile_to is None:
+                vm.run(max_steps)
+                if not vm.done:
+                    print(f"[錯誤] 執行超過 {max_steps} 個指令，停止執行 (指令 {vm.ip})")
+                    sys.exit(1)
+            else:
+                profile = vm.run_profiled()
+                if profile_to == '-':
+                    print(profile.report(vm))
+                else:
+                    with open(profile_to, 'w', encoding='utf-8') as f:
+                        json.dump(profile.to_dict(vm), f, indent=2)
+        except (ValueError, RecursionError, ZeroDivisionError) as e:
+            print(f"[錯誤] 執行時發生問題 (指令 {vm.ip}): {type(e).__name__}: {e}")
+            sys.exit(1)
     else:
-        print("未讀取到任何有效的中間碼指令。")
\ No newline at end of file
+        print("未讀取到任何有效的中間碼指令。")
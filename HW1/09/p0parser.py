@@ -0,0 +1,149 @@
+import heapq
+import re
+import sys
+from collections import namedtuple
+
+# 二元運算子的優先順序 (數字越大越先結合)，全部都是左結合
+PRECEDENCE = {
+    '<=': 1, '==': 1,
+    '+': 2, '-': 2,
+    '*': 3, '/': 3,
+}
+
+# token[0]、token[1] 和原本的 (kind, value) tuple 一樣，另外記下在原始碼的位置 (從 1 開始)
+Token = namedtuple('Token', 'kind value line column')
+
+def tokenize(code, token_specification):
+    """
+    依 token_specification [(名稱, 正規表達式), ...] 逐一產生 Token 的 generator，
+    不會先建出整個 token list。SKIP 不產生 token；遇到規則之外的字元時
+    丟出 SyntaxError 並指出行號與欄號，不會默默地在那裡停下來。
+    """
+    tok_regex = '|'.join('(?P<%s>%s)' % pair for pair in token_specification)
+    line, line_start = 1, 0
+    for mo in re.finditer(tok_regex + '|(?P<MISMATCH>.)', code, re.DOTALL):
+        kind = mo.lastgroup
+        if kind == 'SKIP':
+            # 只有空白會跨行，行號在這裡更新
+            newlines = mo.group().count('\n')
+            if newlines:
+                line += newlines
+                line_start = mo.start() + mo.group().rindex('\n') + 1
+        elif kind == 'MISMATCH':
+            raise SyntaxError(f"Illegal character {mo.group()!r} "
+                              f"at line {line}, column {mo.start() - line_start + 1}")
+        else:
+            yield Token(kind, mo.group(), line, mo.start() - line_start + 1)
+
+class TokenStream:
+    """包住 tokenize() 的 generator，只預先讀一個 token (peek)"""
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+        self.current = next(self.tokens, None)
+
+    def peek(self):
+        return self.current
+
+    def advance(self):
+        token = self.current
+        self.current = next(self.tokens, None)
+        return token
+
+class ExpressionParser:
+    """
+    04-p0ifwhile 和 05-p0func 的 Compiler 共用的運算式解析 (precedence climbing)。
+
+    子類別在 __init__ 呼叫 init_temps()，並提供 peek()、consume()、emit()，
+    以及 parse_term() 解析一個運算元 (變數、數字或函數呼叫)，傳回存放結果的名稱。
+    括號在這裡處理。
+
+    暫存變數 $tN 用完就放回 free list，下一次 new_temp() 先拿編號最小的來用，
+    所以一個函數裡不同的 $tN 個數只取決於最複雜的那個運算式同時需要幾個暫存變數。
+    名稱以 $ 開頭，tokenizer 切不出這種 ID，所以不會和使用者的變數 (例如 t5) 撞名。
+    暫存變數不會跨越敘述 (條件在 if_false 就用掉了)，每個敘述開始時呼叫
+    release_temps() 把全部放回去。
+    """
+    def init_temps(self):
+        self.temp_count = 0 # 用過幾個不同的暫存變數
+        self.free_temps = [] # 可以重用的編號 (heap)
+        self.live_temps = set()
+
+    def new_temp(self):
+        if self.free_temps:
+            t = f"$t{heapq.heappop(self.free_temps)}"
+        else:
+            t = f"$t{self.temp_count}"
+            self.temp_count += 1
+        self.live_temps.add(t)
+        return t
+
+    def release(self, *names):
+        # 不是暫存變數 (一般變數或常數) 的名稱直接忽略
+        for name in names:
+            if name in self.live_temps:
+                self.live_temps.remove(name)
+                heapq.heappush(self.free_temps, int(name[2:]))
+
+    def release_temps(self):
+        self.release(*list(self.live_temps))
+
+    def parse_expression(self, min_precedence=1):
+        left = self.parse_operand()
+        while True:
+            token = self.peek()
+            if not token or token[0] != 'OP' or PRECEDENCE.get(token[1], 0) < min_precedence:
+                return left
+            op = self.consume()[1]
+            # 右邊只吃優先順序更高的運算子，同一級的留給這個迴圈，所以是左結合
+            right = self.parse_expression(PRECEDENCE[op] + 1)
+            self.release(left, right)
+            temp = self.new_temp()
+            self.emit(op, left, right, temp)
+            left = temp
+
+    def parse_operand(self):
+        token = self.peek()
+        if token and token[1] == '(':
+            self.consume('(')
+            result = self.parse_expression()
+            self.consume(')')
+            return result
+        return self.parse_term()
+
+class _Quads(ExpressionParser):
+    # 命令列用：只解析一個運算式，運算元只有變數和數字
+    def __init__(self, text):
+        self.tokens = TokenStream(tokenize(text, [
+            ('OP',   r'<=|==|[-+*/]'),
+            ('TERM', r'\w+'),
+            ('SKIP', r'\s+'),
+            ('MISC', r'[()]'),
+        ]))
+        self.init_temps()
+        self.ir_code = []
+
+    def peek(self):
+        return self.tokens.peek()
+
+    def consume(self, expected_value=None):
+        token = self.peek()
+        if not token or (expected_value and token[1] != expected_value):
+            raise SyntaxError(f"Expected '{expected_value}', found {token}")
+        return self.tokens.advance()
+
+    def emit(self, op, arg1, arg2, result):
+        self.ir_code.append((op, arg1, arg2, result))
+
+    def parse_term(self):
+        return self.consume()[1]
+
+# run: python p0parser.py "a + b * c <= (d - e) / 2"   (印出運算式產生的四元組)
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('用法: python p0parser.py "<運算式>"')
+        sys.exit(1)
+    parser = _Quads(' '.join(sys.argv[1:]))
+    result = parser.parse_expression()
+    for op, a1, a2, res in parser.ir_code:
+        print(f"{op:<10} {a1:<10} {a2:<10} {res:<10}")
+    print(f"結果在 {result}，用了 {parser.temp_count} 個暫存變數")